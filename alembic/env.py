@@ -13,6 +13,10 @@ from app.models.book import Book, Order, BookStat
 
 config = context.config
 
+# URL базы тот же, что у приложения (DATABASE_URL, в том числе из .env); alembic.ini — запасной
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"].replace("%", "%%"))
+
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
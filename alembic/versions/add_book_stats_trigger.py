@@ -0,0 +1,61 @@
+"""maintain book_stats from orders with a statement-level trigger
+
+Revision ID: add_book_stats_trigger
+Revises: add_books_keyset_indexes
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_book_stats_trigger'
+down_revision = 'add_books_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Выручка по популярной книге быстро переполняет numeric(10, 2)
+    op.alter_column('book_stats', 'total_revenue',
+                    type_=sa.Numeric(precision=14, scale=2),
+                    existing_type=sa.Numeric(precision=10, scale=2))
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_stats_on_orders_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO book_stats (book_id, total_orders, total_revenue)
+            SELECT book_id, count(*), coalesce(sum(total_price), 0)
+            FROM new_orders
+            GROUP BY book_id
+            ORDER BY book_id
+            ON CONFLICT (book_id) DO UPDATE
+            SET total_orders = book_stats.total_orders + EXCLUDED.total_orders,
+                total_revenue = book_stats.total_revenue + EXCLUDED.total_revenue;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_orders_book_stats
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_orders
+        FOR EACH STATEMENT EXECUTE FUNCTION book_stats_on_orders_insert();
+    """)
+
+    # Заполняем статистику по уже существующим заказам
+    op.execute("""
+        INSERT INTO book_stats (book_id, total_orders, total_revenue)
+        SELECT book_id, count(*), coalesce(sum(total_price), 0)
+        FROM orders
+        GROUP BY book_id
+        ON CONFLICT (book_id) DO UPDATE
+        SET total_orders = EXCLUDED.total_orders,
+            total_revenue = EXCLUDED.total_revenue;
+    """)
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_orders_book_stats ON orders;")
+    op.execute("DROP FUNCTION IF EXISTS book_stats_on_orders_insert();")
+    op.alter_column('book_stats', 'total_revenue',
+                    type_=sa.Numeric(precision=10, scale=2),
+                    existing_type=sa.Numeric(precision=14, scale=2))
@@ -0,0 +1,34 @@
+"""add composite (col, id) indexes for keyset pagination
+
+Revision ID: add_books_keyset_indexes
+Revises: add_pg_trgm_extension
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_books_keyset_indexes'
+down_revision = 'add_pg_trgm_extension'
+branch_labels = None
+depends_on = None
+
+KEYSET_INDEXES = [
+    ('ix_books_title_id', ['title', 'id']),
+    ('ix_books_author_id', ['author', 'id']),
+    ('ix_books_price_id', ['price', 'id']),
+    ('ix_books_published_date_id', ['published_date', 'id']),
+]
+
+def upgrade() -> None:
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большую таблицу
+    with op.get_context().autocommit_block():
+        for name, columns in KEYSET_INDEXES:
+            op.create_index(name, 'books', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in KEYSET_INDEXES:
+            op.drop_index(name, table_name='books', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,33 @@
+"""add B-tree indexes on numeric metadata_info keys for range queries
+
+Revision ID: add_books_metadata_numeric_indexes
+Revises: add_daily_sales_rollup
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_books_metadata_numeric_indexes'
+down_revision = 'add_daily_sales_rollup'
+branch_labels = None
+depends_on = None
+
+METADATA_INDEXES = [
+    ('ix_books_metadata_pages', 'pages'),
+    ('ix_books_metadata_rating', 'rating'),
+]
+
+def upgrade() -> None:
+    # GIN по metadata_info не обслуживает сравнения на больше/меньше,
+    # поэтому частые числовые ключи получают B-tree по выражению
+    with op.get_context().autocommit_block():
+        for name, key in METADATA_INDEXES:
+            op.create_index(name, 'books', [sa.text(f"(metadata_info -> '{key}')")], unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in METADATA_INDEXES:
+            op.drop_index(name, table_name='books', postgresql_concurrently=True, if_exists=True)
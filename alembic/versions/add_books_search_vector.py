@@ -0,0 +1,35 @@
+"""stored tsvector column with GIN index for ranked full-text search
+
+Revision ID: add_books_search_vector
+Revises: add_books_metadata_numeric_indexes
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_books_search_vector'
+down_revision = 'add_books_metadata_numeric_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Добавление хранимой генерируемой колонки переписывает таблицу под
+    # ACCESS EXCLUSIVE блокировкой: на большом каталоге — в окно обслуживания
+    op.execute("""
+        ALTER TABLE books ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple'::regconfig, coalesce(author, '')), 'B') ||
+            setweight(jsonb_to_tsvector('simple'::regconfig, coalesce(metadata_info -> 'tags', '[]'::jsonb), '["string"]'), 'C') ||
+            setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'D')
+        ) STORED;
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_search_vector', 'books', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_search_vector', table_name='books', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('books', 'search_vector')
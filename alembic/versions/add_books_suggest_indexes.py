@@ -0,0 +1,33 @@
+"""add lower(col) COLLATE "C" indexes for prefix suggestions
+
+Revision ID: add_books_suggest_indexes
+Revises: add_books_search_vector
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_books_suggest_indexes'
+down_revision = 'add_books_search_vector'
+branch_labels = None
+depends_on = None
+
+SUGGEST_INDEXES = [
+    ('ix_books_title_lower_c', 'title'),
+    ('ix_books_author_lower_c', 'author'),
+]
+
+def upgrade() -> None:
+    # В collation "C" один индекс обслуживает и LIKE 'abc%', и ORDER BY,
+    # поэтому страница подсказок читается одним range scan без сортировки
+    with op.get_context().autocommit_block():
+        for name, column in SUGGEST_INDEXES:
+            op.create_index(name, 'books', [sa.text(f'(lower({column}) COLLATE "C")')], unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in SUGGEST_INDEXES:
+            op.drop_index(name, table_name='books', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,22 @@
+"""add books.version row counter for ETags
+
+Revision ID: add_books_version
+Revises: add_books_suggest_indexes
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_books_version'
+down_revision = 'add_books_suggest_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Константный DEFAULT не переписывает таблицу (PostgreSQL 11+)
+    op.add_column('books', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+def downgrade() -> None:
+    op.drop_column('books', 'version')
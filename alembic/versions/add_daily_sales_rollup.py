@@ -0,0 +1,62 @@
+"""daily_sales rollup maintained by a statement-level trigger on orders
+
+Revision ID: add_daily_sales_rollup
+Revises: add_genre_stats_mv
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_daily_sales_rollup'
+down_revision = 'add_genre_stats_mv'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('daily_sales',
+    sa.Column('sales_date', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('shard', sa.SmallInteger(), nullable=False),
+    sa.Column('total_sales', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('sales_date', 'status', 'shard')
+    )
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION daily_sales_on_orders_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO daily_sales (sales_date, status, shard, total_sales, order_count)
+            SELECT order_date, coalesce(status, 'pending'), id % 8,
+                   coalesce(sum(total_price), 0), count(*)
+            FROM new_orders
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+            ON CONFLICT (sales_date, status, shard) DO UPDATE
+            SET total_sales = daily_sales.total_sales + EXCLUDED.total_sales,
+                order_count = daily_sales.order_count + EXCLUDED.order_count;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_orders_daily_sales
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_orders
+        FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_on_orders_insert();
+    """)
+
+    # Заполняем сводку по уже существующим заказам
+    op.execute("""
+        INSERT INTO daily_sales (sales_date, status, shard, total_sales, order_count)
+        SELECT order_date, coalesce(status, 'pending'), id % 8,
+               coalesce(sum(total_price), 0), count(*)
+        FROM orders
+        GROUP BY 1, 2, 3;
+    """)
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_orders_daily_sales ON orders;")
+    op.execute("DROP FUNCTION IF EXISTS daily_sales_on_orders_insert();")
+    op.drop_table('daily_sales')
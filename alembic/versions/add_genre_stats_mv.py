@@ -0,0 +1,33 @@
+"""materialized view with per-genre book statistics
+
+Revision ID: add_genre_stats_mv
+Revises: add_book_stats_trigger
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_genre_stats_mv'
+down_revision = 'add_book_stats_trigger'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE MATERIALIZED VIEW genre_stats_mv AS
+        SELECT genre,
+               count(id) AS book_count,
+               sum(quantity) AS total_quantity,
+               avg(price) AS avg_price,
+               now() AS refreshed_at
+        FROM books
+        WHERE genre IS NOT NULL
+        GROUP BY genre;
+    """)
+    # Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ux_genre_stats_mv_genre ON genre_stats_mv (genre);")
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS genre_stats_mv;")
@@ -0,0 +1,150 @@
+"""range-partition orders by month of order_date
+
+Revision ID: add_orders_partitioning
+Revises: add_repricing_jobs
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_orders_partitioning'
+down_revision = 'add_repricing_jobs'
+branch_labels = None
+depends_on = None
+
+ORDER_COLUMNS = "id, book_id, customer_name, customer_email, order_date, quantity, total_price, status"
+
+def _orders_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq'::regclass)"), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('customer_name', sa.String(length=100), nullable=False),
+        sa.Column('customer_email', sa.String(length=100), nullable=False),
+        sa.Column('order_date', sa.Date(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('total_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], name='orders_book_id_fkey'),
+    ]
+
+def _create_orders_indexes():
+    # На секционированной таблице индекс создается в каждой партиции
+    op.create_index(op.f('ix_orders_book_id'), 'orders', ['book_id'], unique=False)
+    op.create_index(op.f('ix_orders_customer_email'), 'orders', ['customer_email'], unique=False)
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.create_index(op.f('ix_orders_order_date'), 'orders', ['order_date'], unique=False)
+    op.create_index(op.f('ix_orders_status'), 'orders', ['status'], unique=False)
+
+def _drop_orders_indexes(table):
+    for column in ('book_id', 'customer_email', 'id', 'order_date', 'status'):
+        op.drop_index(f'ix_orders_{column}', table_name=table)
+
+def _create_orders_triggers():
+    # Функции сводок остаются прежними (add_book_stats_trigger, add_daily_sales_rollup)
+    op.execute("""
+        CREATE TRIGGER trg_orders_book_stats
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_orders
+        FOR EACH STATEMENT EXECUTE FUNCTION book_stats_on_orders_insert();
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_orders_daily_sales
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_orders
+        FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_on_orders_insert();
+    """)
+
+def _drop_orders_triggers(table):
+    op.execute(f"DROP TRIGGER IF EXISTS trg_orders_book_stats ON {table};")
+    op.execute(f"DROP TRIGGER IF EXISTS trg_orders_daily_sales ON {table};")
+
+def upgrade() -> None:
+    # Заказы копируются в новую таблицу; запись в orders ждет до конца
+    # миграции, чтение продолжается
+    op.execute("LOCK TABLE orders IN EXCLUSIVE MODE")
+    _drop_orders_triggers('orders')
+    _drop_orders_indexes('orders')
+    op.rename_table('orders', 'orders_unpartitioned')
+    op.execute("ALTER INDEX orders_pkey RENAME TO orders_unpartitioned_pkey")
+
+    # Ключ партиционирования обязан входить в первичный ключ
+    op.create_table('orders',
+    *_orders_columns(),
+    sa.PrimaryKeyConstraint('id', 'order_date'),
+    postgresql_partition_by='RANGE (order_date)'
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION orders_create_partition(month date) RETURNS text AS $$
+        DECLARE
+            lower_bound date := date_trunc('month', month)::date;
+            upper_bound date := (date_trunc('month', month) + interval '1 month')::date;
+            partition_name text := 'orders_' || to_char(month, 'YYYY_MM');
+        BEGIN
+            -- Воркеры и скрипты создают партиции по очереди
+            PERFORM pg_advisory_xact_lock(hashtext('orders_create_partition'));
+            IF to_regclass(partition_name) IS NOT NULL THEN
+                RETURN NULL;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE orders INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM orders_default WHERE order_date >= %L AND order_date < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                lower_bound, upper_bound, partition_name
+            );
+            EXECUTE format('ALTER TABLE orders ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, lower_bound, upper_bound);
+            RETURN partition_name;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION orders_create_partitions(date_from date, date_to date) RETURNS SETOF text AS $$
+            SELECT created
+            FROM generate_series(date_trunc('month', date_from), date_trunc('month', date_to), interval '1 month') AS month,
+                 orders_create_partition(month::date) AS created
+            WHERE created IS NOT NULL;
+        $$ LANGUAGE sql;
+    """)
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT;")
+
+    # Партиция на каждый месяц, в котором есть заказы, и на три месяца вперед
+    op.execute("""
+        SELECT orders_create_partition(month::date)
+        FROM (
+            SELECT DISTINCT date_trunc('month', order_date) FROM orders_unpartitioned
+            UNION
+            SELECT generate_series(date_trunc('month', current_date),
+                                   date_trunc('month', current_date + interval '3 months'), interval '1 month')
+        ) AS months(month);
+    """)
+    # Триггеров на новой таблице еще нет: сводки не пересчитываются
+    op.execute(f"INSERT INTO orders ({ORDER_COLUMNS}) SELECT {ORDER_COLUMNS} FROM orders_unpartitioned;")
+    op.drop_table('orders_unpartitioned')
+
+    _create_orders_indexes()
+    _create_orders_triggers()
+
+def downgrade() -> None:
+    # Отсоединенные (архивные) партиции не возвращаются: они остаются отдельными таблицами
+    op.execute("LOCK TABLE orders IN EXCLUSIVE MODE")
+    _drop_orders_triggers('orders')
+    _drop_orders_indexes('orders')
+    op.rename_table('orders', 'orders_partitioned')
+    op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+
+    op.create_table('orders',
+    *_orders_columns(),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute(f"INSERT INTO orders ({ORDER_COLUMNS}) SELECT {ORDER_COLUMNS} FROM orders_partitioned;")
+    op.drop_table('orders_partitioned')
+    op.execute("DROP FUNCTION IF EXISTS orders_create_partitions(date, date);")
+    op.execute("DROP FUNCTION IF EXISTS orders_create_partition(date);")
+
+    _create_orders_indexes()
+    _create_orders_triggers()
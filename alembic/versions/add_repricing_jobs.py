@@ -0,0 +1,46 @@
+"""add repricing_jobs for chunked, resumable bulk repricing
+
+Revision ID: add_repricing_jobs
+Revises: add_books_version
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision = 'add_repricing_jobs'
+down_revision = 'add_books_version'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('repricing_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('genres', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('change_type', sa.String(length=10), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('batch_size', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('last_book_id', sa.Integer(), nullable=False),
+    sa.Column('scan_done', sa.Boolean(), nullable=False),
+    sa.Column('skipped_ids', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('retries', sa.Integer(), nullable=False),
+    sa.Column('updated_books', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Пачка переоценки — range scan по (genre, id) с LIMIT, без сортировки жанра целиком
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_genre_id', 'books', ['genre', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_genre_id', table_name='books', postgresql_concurrently=True, if_exists=True)
+    op.drop_table('repricing_jobs')
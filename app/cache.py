@@ -0,0 +1,202 @@
+"""
+Кеши в памяти процесса.
+
+CacheBackend — интерфейс хранилища; MemoryCache — LRU с ограничением
+количества записей и временем жизни, NullCache — отключенный кеш.
+Бэкенд для чтений книг выбирается переменной CACHE_BACKEND (memory|none),
+свою реализацию (например, внешнее хранилище) можно подставить через
+book_cache.backend.
+
+BookCache кеширует чтения книг:
+  - отдельные книги — по ключу ("book", id), удаляются точечно при записи;
+  - страницы списков и агрегаты — по ключу с номером поколения: любая запись
+    в books увеличивает поколение, и старые списки больше не находятся,
+    а вытесняются по LRU/TTL.
+Кешируются только ограниченные по размеру результаты: выборки без LIMIT
+(/books/filter/advanced/) всегда читаются из базы, иначе BOOK_CACHE_SIZE
+записей могли бы держать каталог целиком каждая.
+Поколение живет в процессе: при нескольких воркерах изменения, сделанные
+в другом процессе, видны не позже чем через TTL.
+"""
+import abc
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+# Отличает «нет в кеше» от закешированного None (например, книга не найдена)
+MISSING = object()
+
+
+class CacheBackend(abc.ABC):
+    """Интерфейс хранилища кеша"""
+
+    @abc.abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: Hashable, value: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, *keys: Hashable) -> None:
+        ...
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class MemoryCache(CacheBackend):
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class NullCache(CacheBackend):
+    """Кеш выключен: каждое чтение идет в базу"""
+
+    def __init__(self, maxsize: int = 0, ttl: float = 0):
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        pass
+
+    def delete(self, *keys: Hashable) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "none", "hits": 0, "misses": self.misses}
+
+
+BACKENDS = {"memory": MemoryCache, "none": NullCache}
+
+
+def create_backend(name: str, maxsize: int, ttl: float) -> CacheBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный CACHE_BACKEND: {name!r}, доступны: {', '.join(BACKENDS)}")
+    return BACKENDS[name](maxsize=maxsize, ttl=ttl)
+
+
+class BookCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.generation = 0
+        self.invalidations = 0
+        self.invalidated_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def book_key(book_id: int) -> tuple:
+        return ("book", book_id)
+
+    def query_key(self, *parts: Hashable) -> tuple:
+        return ("query", self.generation) + parts
+
+    def get(self, key: Hashable) -> Any:
+        return self.backend.get(key, MISSING)
+
+    def set(self, key: Hashable, value: Any, generation: int) -> None:
+        """
+        Сохраняет значение, только если с начала чтения (generation) не было
+        записей: иначе в кеш могла бы попасть строка, прочитанная до коммита.
+        """
+        if generation == self.generation:
+            self.backend.set(key, value)
+
+    def invalidate(self, book_ids: Iterable[int] = ()) -> None:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self.invalidated_at = time.monotonic()
+        self.backend.delete(*(self.book_key(book_id) for book_id in book_ids))
+
+    def settled(self, seconds: float) -> bool:
+        """С последней инвалидации прошло не меньше seconds"""
+        return time.monotonic() - self.invalidated_at >= seconds
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), "generation": self.generation, "invalidations": self.invalidations}
+
+
+book_cache = BookCache(create_backend(
+    os.getenv("CACHE_BACKEND", "memory"),
+    maxsize=int(os.getenv("BOOK_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("BOOK_CACHE_TTL", "30")),
+))
+
+# Подсказки для строки поиска: короткий TTL, чтобы новые книги быстро появлялись
+suggest_cache = MemoryCache(
+    maxsize=int(os.getenv("SUGGEST_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("SUGGEST_CACHE_TTL", "30")),
+)
+
+
+def cache_stats() -> dict:
+    return {"books": book_cache.stats(), "suggest": suggest_cache.stats()}
@@ -1,178 +1,1193 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func, desc, asc
-from typing import List, Optional, Dict, Any
-from app.models.book import Book, Order
-from app.schemas.book import BookCreate, BookUpdate, OrderCreate
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, union_all, or_, and_, func, desc, asc, tuple_, text, literal, literal_column, cast, event
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONB, JSONPATH
+from sqlalchemy.exc import DBAPIError
+from typing import List, Optional, Dict, Any, Iterable, Sequence, Tuple
+from app.models.book import Book, Order, BookStat, DailySales, RepricingJob, DAILY_SALES_SHARDS, SEARCH_CONFIG, genre_stats_mv
+from app.schemas.book import BookCreate, BookUpdate, BookInDB, OrderCreate, RepricingCreate
+from app.cache import MISSING, book_cache
+from app.replicas import DB_REPLICA_MAX_LAG, read_from_replica
+from app.metadata_query import INDEXED_NUMERIC_KEYS, range_jsonpath
 from decimal import Decimal
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+import asyncio
+import json
+import os
+import time
+
+# Размер пачки для потоковых выборок через серверный курсор (yield_per)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Построители запросов. Общие для синхронного (BookCRUD/OrderCRUD)
+# и асинхронного (AsyncBookCRUD/AsyncOrderCRUD) слоев, чтобы SQL
+# не расходился между ними.
+
+# Колонки книги без поискового вектора. Списки читаются ими как строки
+# Core (без identity map и ORM-объектов) и отдаются как словари
+_BOOK_COLUMNS = [column for column in Book.__table__.c if column.key != "search_vector"]
+
+def _book_columns(fields: Optional[Sequence[str]]):
+    """Колонки для SELECT: проверенный список fields (app/projection.py) или все"""
+    return [Book.__table__.c[name] for name in fields] if fields else _BOOK_COLUMNS
+
+def _book_by_id(book_id: int):
+    return select(Book).where(Book.id == book_id)
+
+def _books_stmt(
+    skip: int, limit: int, sort_by: Optional[str], sort_desc: bool, fields: Optional[Sequence[str]] = None
+):
+    stmt = select(*_book_columns(fields))
+    if sort_by:
+        sort_column = getattr(Book, sort_by, None)
+        if sort_column is not None:
+            stmt = stmt.order_by(desc(sort_column) if sort_desc else asc(sort_column))
+    return stmt.offset(skip).limit(limit)
+
+def _book_versions_stmt(skip: int, limit: int, sort_by: Optional[str], sort_desc: bool):
+    """Та же страница, что _books_stmt, но только (id, version) — для ETag"""
+    return _books_stmt(skip, limit, sort_by, sort_desc).with_only_columns(Book.id, Book.version)
+
+def _keyset_segments(sort_by: Optional[str], sort_desc: bool, after: Optional[Tuple[Any, int]]):
+    """Запросы сегментов keyset-страницы в порядке выдачи (без LIMIT)"""
+    order = desc if sort_desc else asc
+
+    if sort_by is None:
+        stmt = select(*_BOOK_COLUMNS)
+        if after:
+            stmt = stmt.where(Book.id < after[1] if sort_desc else Book.id > after[1])
+        return [stmt.order_by(order(Book.id))]
+
+    column = getattr(Book, sort_by)
+    nullable = Book.__table__.c[sort_by].nullable
+
+    # PostgreSQL по умолчанию ставит NULL в конец при ASC и в начало при DESC,
+    # поэтому выборка разбивается на сегмент NULL-значений и сегмент значений,
+    # каждый из которых обслуживается индексом (col, id)
+    values_segment = [column.isnot(None)]
+    nulls_segment = [column.is_(None)] if nullable else None
+    if after:
+        last_value, last_id = after
+        if last_value is None:
+            if nulls_segment is None:
+                return []
+            nulls_segment.append(Book.id < last_id if sort_desc else Book.id > last_id)
+            if not sort_desc:
+                values_segment = None
+        else:
+            key = tuple_(column, Book.id)
+            values_segment = [key < tuple_(last_value, last_id) if sort_desc
+                              else key > tuple_(last_value, last_id)]
+            if sort_desc:
+                nulls_segment = None
+
+    segments = [
+        (values_segment, [order(column), order(Book.id)]),
+        (nulls_segment, [order(Book.id)]),
+    ]
+    if sort_desc:
+        segments.reverse()
+    return [
+        select(*_BOOK_COLUMNS).where(*filters).order_by(*ordering)
+        for filters, ordering in segments if filters is not None
+    ]
+
+def _upsert_books_stmt(rows: List[dict]):
+    """Многострочный INSERT ... ON CONFLICT (isbn) DO UPDATE; запись из фида заменяет все поля книги"""
+    stmt = pg_insert(Book).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Book.isbn],
+        set_={
+            **{key: stmt.excluded[key] for key in rows[0] if key != "isbn"},
+            "version": Book.version + 1,
+        }
+    )
+    # xmax = 0 только у только что вставленных строк
+    return stmt.returning(Book.id, literal_column("xmax = 0").label("inserted"))
+
+def _count_upserted(returned_rows):
+    inserted = sum(1 for row in returned_rows if row.inserted)
+    return inserted, len(returned_rows) - inserted
+
+def _books_by_filters_stmt(
+    genre: Optional[str],
+    min_price: Optional[Decimal],
+    max_price: Optional[Decimal],
+    min_date: Optional[date],
+    in_stock: Optional[bool],
+    fields: Optional[Sequence[str]] = None
+):
+    filters = []
+    if genre:
+        filters.append(Book.genre == genre)
+    if min_price:
+        filters.append(Book.price >= min_price)
+    if max_price:
+        filters.append(Book.price <= max_price)
+    if min_date:
+        filters.append(Book.published_date >= min_date)
+    if in_stock is not None:
+        if in_stock:
+            filters.append(Book.quantity > 0)
+        else:
+            filters.append(Book.quantity == 0)
+
+    stmt = select(*_book_columns(fields))
+    if filters:
+        stmt = stmt.where(and_(*filters))
+    return stmt
+
+def _books_with_orders_stmt(skip: int, limit: int):
+    """
+    Страница книг, у которых есть заказы. EXISTS вместо JOIN: одна строка
+    на книгу, OFFSET/LIMIT считаются в книгах. Заказы всех книг страницы
+    подгружаются одним SELECT ... WHERE book_id IN (...) — два запроса
+    на страницу при любом limit (до 500, размер пачки selectinload).
+    """
+    return (
+        select(Book)
+        .where(Book.orders.any())
+        .order_by(Book.id)
+        .offset(skip)
+        .limit(limit)
+        .options(selectinload(Book.orders))
+    )
+
+# Статистика по жанрам читается из genre_stats_mv; представление
+# пересчитывается, когда оно старше GENRE_STATS_MAX_AGE секунд или по запросу
+GENRE_STATS_MAX_AGE = int(os.getenv("GENRE_STATS_MAX_AGE", "60"))
+# Ключ advisory-блокировки: пересчет выполняет только один процесс
+_GENRE_STATS_LOCK_KEY = 0x67656E72
+
+def _genre_statistics_stmt():
+    return select(
+        genre_stats_mv.c.genre,
+        genre_stats_mv.c.book_count,
+        genre_stats_mv.c.total_quantity,
+        genre_stats_mv.c.avg_price
+    ).order_by(genre_stats_mv.c.genre)
+
+def _genre_stats_state_stmt(max_age: int):
+    """(refreshed_at, устарело ли представление); пустое считается устаревшим"""
+    refreshed_at = func.max(genre_stats_mv.c.refreshed_at)
+    return select(
+        refreshed_at,
+        func.coalesce(refreshed_at < func.now() - timedelta(seconds=max_age), True)
+    )
+
+_GENRE_STATS_TRY_LOCK = text("SELECT pg_try_advisory_xact_lock(:key)").bindparams(key=_GENRE_STATS_LOCK_KEY)
+_GENRE_STATS_LOCK = text("SELECT pg_advisory_xact_lock(:key)").bindparams(key=_GENRE_STATS_LOCK_KEY)
+_GENRE_STATS_REFRESH = text("REFRESH MATERIALIZED VIEW CONCURRENTLY genre_stats_mv")
+
+# Пакетная переоценка. Книги обходятся по возрастанию id пачками по
+# REPRICE_BATCH_SIZE, каждая пачка — отдельная короткая транзакция.
+# Строки, которые сейчас держит заказ, пропускаются (SKIP LOCKED) и
+# переоцениваются повторно в конце, поэтому create_order не ждет переоценку.
+REPRICE_BATCH_SIZE = int(os.getenv("REPRICE_BATCH_SIZE", "500"))
+REPRICE_MAX_RETRIES = int(os.getenv("REPRICE_MAX_RETRIES", "10"))
+REPRICE_RETRY_DELAY = float(os.getenv("REPRICE_RETRY_DELAY", "0.2"))
+REPRICE_CHANGE_TYPES = ("percent", "absolute")
+
+def _reprice_filters(genres: Sequence[str]):
+    # Как и прежде у скидки: только книги в наличии и с ценой
+    return [Book.genre.in_(genres), Book.price > 0, Book.quantity > 0]
+
+def _reprice_candidates_stmt(genres: Sequence[str], after_id: int, batch_size: int):
+    """
+    Следующие batch_size книг после after_id. По каждому жанру — range scan
+    по ix_books_genre_id с LIMIT, затем общий порядок по id.
+    """
+    per_genre = union_all(*(
+        select(Book.id)
+        .where(Book.genre == genre, Book.id > after_id, Book.price > 0, Book.quantity > 0)
+        .order_by(Book.id)
+        .limit(batch_size)
+        for genre in genres
+    )).subquery()
+    return select(per_genre.c.id).order_by(per_genre.c.id).limit(batch_size)
+
+def _new_price(change_type: str, amount: Decimal):
+    """percent: +10 — наценка 10%, -10 — скидка 10%; absolute — сдвиг цены. Не ниже нуля"""
+    price = Book.price * (1 + amount / 100) if change_type == "percent" else Book.price + amount
+    return func.greatest(price, 0)
+
+def _reprice_stmt(book_ids: Sequence[int], genres: Sequence[str], change_type: str, amount: Decimal):
+    lockable = (
+        select(Book.id)
+        .where(Book.id.in_(book_ids), *_reprice_filters(genres))
+        .with_for_update(skip_locked=True)
+    )
+    return update(Book).where(Book.id.in_(lockable)).values(
+        price=_new_price(change_type, amount),
+        version=Book.version + 1
+    ).returning(Book.id).execution_options(synchronize_session=False)
+
+def _reprice_pending_stmt(book_ids: Sequence[int], genres: Sequence[str]):
+    """Из непереоцененных id — те, что все еще подходят: их держала чужая транзакция"""
+    return select(Book.id).where(Book.id.in_(book_ids), *_reprice_filters(genres)).order_by(Book.id)
+
+# Используем PostgreSQL операторы для поиска в JSON
+def _metadata_search_stmt(fields: Optional[Sequence[str]] = None):
+    columns = ", ".join(column.key for column in _book_columns(fields))
+    return text(f"""
+        SELECT {columns}
+        FROM books
+        WHERE metadata_info::text LIKE :pattern
+        OR EXISTS (
+            SELECT 1 FROM jsonb_each_text(metadata_info)
+            WHERE value LIKE :pattern
+        )
+    """).execution_options(replica_safe=True)
+
+def _metadata_query_stmt(
+    contains: Optional[Dict[str, Any]],
+    keys: Optional[List[str]],
+    tags: Optional[List[str]],
+    ranges: Optional[List[Tuple[str, Optional[float], Optional[float]]]],
+    skip: int,
+    limit: int,
+    fields: Optional[Sequence[str]] = None
+):
+    """
+    Условия только из операторов, которые обслуживает GIN-индекс по
+    metadata_info: @> (containment), ? (наличие ключа), @? (jsonpath)
+    """
+    metadata = Book.metadata_info
+    document = dict(contains or {})
+    if tags:
+        existing = document.get("tags", [])
+        document["tags"] = (existing if isinstance(existing, list) else [existing]) + list(tags)
+
+    filters = []
+    if document:
+        filters.append(metadata.contains(document))
+    for key in keys or []:
+        filters.append(metadata.has_key(key))
+    for key, low, high in ranges or []:
+        if key not in INDEXED_NUMERIC_KEYS:
+            filters.append(metadata.path_exists(cast(range_jsonpath(key, low, high), JSONPATH)))
+            continue
+        # Выражение должно совпасть с индексом буквально, поэтому ключ — литерал,
+        # а не параметр. jsonb сравнивает числа как числа; проверка типа
+        # отсекает строки и булевы значения, попавшие в открытый диапазон.
+        value = metadata[literal_column(f"'{key}'")]
+        filters.append(func.jsonb_typeof(value) == "number")
+        if low is not None:
+            filters.append(value >= cast(literal(json.dumps(low)), JSONB))
+        if high is not None:
+            filters.append(value <= cast(literal(json.dumps(high)), JSONB))
+
+    return select(*_book_columns(fields)).where(*filters).order_by(Book.id).offset(skip).limit(limit)
+
+_SEARCH_CONFIG = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+_HEADLINE_OPTIONS = "StartSel=<b>, StopSel=</b>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+def _fulltext_stmt(
+    search_term: str, skip: int = 0, limit: Optional[int] = None, fields: Optional[Sequence[str]] = None
+):
+    """
+    Поиск по search_vector (GIN ix_books_search_vector) с ранжированием ts_rank.
+    Страница выбирается во внутреннем запросе, а дорогой ts_headline
+    считается только для ее строк.
+    """
+    query = func.websearch_to_tsquery(_SEARCH_CONFIG, search_term)
+    rank = func.ts_rank(Book.search_vector, query)
+    page = (
+        select(Book.id, rank.label("rank"))
+        .where(Book.search_vector.op("@@")(query))
+        .order_by(rank.desc(), Book.id)
+        .offset(skip)
+        .limit(limit)
+        .subquery()
+    )
+    return select(
+        *_book_columns(fields),
+        page.c.rank,
+        func.ts_headline(_SEARCH_CONFIG, Book.title, query, _HEADLINE_OPTIONS).label("title_highlight"),
+        func.ts_headline(
+            _SEARCH_CONFIG, func.coalesce(Book.description, ""), query, _HEADLINE_OPTIONS
+        ).label("snippet")
+    ).join(page, Book.id == page.c.id).order_by(page.c.rank.desc(), Book.id)
+
+# Подсказки для строки поиска. Префикс ищется по индексам
+# lower(col) COLLATE "C": и LIKE 'abc%', и ORDER BY обслуживает один
+# range scan. Если совпадений по префиксу мало, добираем опечатки
+# триграммами (оператор % через GIN ix_books_*_trgm).
+SUGGEST_TIMEOUT_MS = int(os.getenv("SUGGEST_TIMEOUT_MS", "150"))
+SUGGEST_TRGM_MIN_LENGTH = 3
+_SUGGEST_FIELDS = (("titles", Book.title), ("authors", Book.author))
+_SUGGEST_TIMEOUT = text(f"SET LOCAL statement_timeout = {SUGGEST_TIMEOUT_MS}").execution_options(replica_safe=True)
+
+def _like_prefix(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _suggest_prefix_stmt(prefix: str, limit: int):
+    parts = []
+    for field, column in _SUGGEST_FIELDS:
+        key = func.lower(column).collate("C")
+        parts.append(
+            select(literal(field).label("field"), column.label("value"))
+            .distinct(key)
+            .where(key.like(_like_prefix(prefix), escape="\\"))
+            .order_by(key)
+            .limit(limit)
+        )
+    return parts[0].union_all(*parts[1:])
+
+def _suggest_trgm_stmt(term: str, limit: int):
+    parts = []
+    for field, column in _SUGGEST_FIELDS:
+        candidates = (
+            select(column.label("value"), column.op("<->")(term).label("distance"))
+            .where(column.op("%")(term))
+            .order_by("distance")
+            .limit(limit * 4)
+            .subquery()
+        )
+        parts.append(
+            select(literal(field).label("field"), candidates.c.value)
+            .group_by(candidates.c.value)
+            .order_by(func.min(candidates.c.distance))
+            .limit(limit)
+        )
+    return parts[0].union_all(*parts[1:])
+
+def _is_statement_timeout(error: DBAPIError) -> bool:
+    return getattr(error.orig, "pgcode", None) == "57014"
+
+def _merge_suggestions(found: Dict[str, List[str]], rows, limit: int):
+    for field, value in rows:
+        values = found[field]
+        if len(values) < limit and value.lower() not in {v.lower() for v in values}:
+            values.append(value)
+    return found
+
+def _needs_trgm(term: str, found: Dict[str, List[str]], limit: int) -> bool:
+    return len(term) >= SUGGEST_TRGM_MIN_LENGTH and any(len(values) < limit for values in found.values())
+
+def _place_order_stmt(order: OrderCreate):
+    """
+    Оформление заказа одним запросом: условное списание со склада и вставка
+    заказа в одном round trip. Строка книги блокируется только на время
+    UPDATE, а при нехватке запаса CTE не возвращает строк и заказ не создается.
+    """
+    reserved = (
+        update(Book)
+        .where(Book.id == order.book_id, Book.quantity >= order.quantity)
+        .values(quantity=Book.quantity - order.quantity, version=Book.version + 1)
+        .returning(Book.id, Book.price)
+        .cte("reserved")
+    )
+    data = order.dict()
+    columns = ["book_id", "customer_name", "customer_email", "order_date", "quantity", "status"]
+    values = [reserved.c.id] + [
+        literal(data[name], Order.__table__.c[name].type) for name in columns[1:]
+    ]
+    return (
+        insert(Order)
+        .from_select(columns + ["total_price"], select(*values, reserved.c.price * order.quantity))
+        .returning(Order)
+    )
+
+def _daily_sales_stmt(target_date: date):
+    return select(
+        func.sum(Order.total_price).label('total_sales'),
+        func.count(Order.id).label('order_count')
+    ).where(Order.order_date == target_date)
+
+def _customer_orders_stmt(email: str, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    # Границы по order_date отсекают партиции orders, которые не нужно читать
+    stmt = select(Order).where(Order.customer_email == email)
+    if date_from is not None:
+        stmt = stmt.where(Order.order_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Order.order_date <= date_to)
+    return stmt.order_by(Order.order_date, Order.id)
+
+def _daily_sales_range_stmt(date_from: date, date_to: date):
+    # Шарды одного дня и статуса схлопываются при чтении
+    return select(
+        DailySales.sales_date,
+        DailySales.status,
+        func.sum(DailySales.total_sales).label('total_sales'),
+        func.sum(DailySales.order_count).label('order_count')
+    ).where(
+        DailySales.sales_date.between(date_from, date_to)
+    ).group_by(DailySales.sales_date, DailySales.status).order_by(DailySales.sales_date, DailySales.status)
+
+
+# Инвалидация кеша книг. Записи копят id измененных книг в session.info,
+# а кеш чистится только после COMMIT: до него конкурентное чтение еще
+# видит старые строки и могло бы вернуть их в кеш.
+_PENDING_INVALIDATION = "book_cache_invalidate"
+
+def _invalidate_books(db, book_ids: Iterable[int] = ()):
+    db.info.setdefault(_PENDING_INVALIDATION, set()).update(book_ids)
+
+@event.listens_for(Session, "after_commit")
+def _apply_book_cache_invalidation(session):
+    book_ids = session.info.pop(_PENDING_INVALIDATION, None)
+    if book_ids is not None:
+        book_cache.invalidate(book_ids)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_book_cache_invalidation(session):
+    session.info.pop(_PENDING_INVALIDATION, None)
+
+async def _read_through(db, key, load):
+    """Значение из кеша или результат load(), сохраненный в кеш"""
+    generation = book_cache.generation
+    value = book_cache.get(key)
+    if value is MISSING:
+        value = await load()
+        # Реплика может еще не видеть недавно закоммиченную запись: такое чтение
+        # не кешируем, пока с последней инвалидации не прошло DB_REPLICA_MAX_LAG
+        if not read_from_replica(db) or book_cache.settled(DB_REPLICA_MAX_LAG):
+            book_cache.set(key, value, generation)
+    return value
+
+def _row_dicts(result) -> List[dict]:
+    """Строки Core как словари: их можно кешировать и сериализовать без валидации"""
+    return [dict(row) for row in result.mappings()]
+
 
 class BookCRUD:
     @staticmethod
     def get_book(db: Session, book_id: int):
-        return db.query(Book).filter(Book.id == book_id).first()
-    
+        return db.execute(_book_by_id(book_id)).scalars().first()
+
+    @staticmethod
+    def get_books(
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False,
+        fields: Optional[Sequence[str]] = None
+    ):
+        return _row_dicts(db.execute(_books_stmt(skip, limit, sort_by, sort_desc, fields)))
+
+    @staticmethod
+    def get_book_versions(
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False
+    ):
+        """Пары (id, version) страницы get_books"""
+        return db.execute(_book_versions_stmt(skip, limit, sort_by, sort_desc)).all()
+
+    # Keyset-пагинация: WHERE (col, id) > (:value, :id) вместо OFFSET,
+    # стоимость страницы не зависит от ее глубины
     @staticmethod
-    def get_books(db: Session, skip: int = 0, limit: int = 100):
-        return db.query(Book).offset(skip).limit(limit).all()
-    
+    def get_books_keyset(
+        db: Session,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False,
+        after: Optional[Tuple[Any, int]] = None,
+        limit: int = 100
+    ):
+        books = []
+        for stmt in _keyset_segments(sort_by, sort_desc, after):
+            if len(books) >= limit:
+                break
+            books.extend(_row_dicts(db.execute(stmt.limit(limit - len(books)))))
+        return books
+
     @staticmethod
     def get_books_by_author(db: Session, author: str):
-        return db.query(Book).filter(Book.author.ilike(f"%{author}%")).all()
-    
+        return db.execute(select(Book).where(Book.author.ilike(f"%{author}%"))).scalars().all()
+
     @staticmethod
     def create_book(db: Session, book: BookCreate):
         db_book = Book(**book.dict())
         db.add(db_book)
+        db.flush()
+        _invalidate_books(db, [db_book.id])
         db.commit()
         db.refresh(db_book)
         return db_book
-    
+
+    # Массовая загрузка: один запрос на пачку, без commit на каждую строку
+    @staticmethod
+    def upsert_books(db: Session, rows: List[dict]):
+        """Возвращает пару (вставлено, обновлено); commit выполняет вызывающий"""
+        if not rows:
+            return 0, 0
+        returned_rows = db.execute(_upsert_books_stmt(rows)).all()
+        _invalidate_books(db, [row.id for row in returned_rows])
+        return _count_upserted(returned_rows)
+
     @staticmethod
     def update_book(db: Session, book_id: int, book_update: BookUpdate):
-        db_book = db.query(Book).filter(Book.id == book_id).first()
+        db_book = db.execute(_book_by_id(book_id)).scalars().first()
         if db_book:
             update_data = book_update.dict(exclude_unset=True)
             for key, value in update_data.items():
                 setattr(db_book, key, value)
+            db_book.version = Book.version + 1
+            _invalidate_books(db, [book_id])
             db.commit()
             db.refresh(db_book)
         return db_book
-    
+
     @staticmethod
     def delete_book(db: Session, book_id: int):
-        db_book = db.query(Book).filter(Book.id == book_id).first()
+        db_book = db.execute(_book_by_id(book_id)).scalars().first()
         if db_book:
             db.delete(db_book)
+            _invalidate_books(db, [book_id])
             db.commit()
         return db_book
-    
+
     # SELECT ... WHERE с несколькими условиями
     @staticmethod
     def get_books_by_filters(
-        db: Session, 
+        db: Session,
         genre: Optional[str] = None,
         min_price: Optional[Decimal] = None,
         max_price: Optional[Decimal] = None,
         min_date: Optional[date] = None,
-        in_stock: Optional[bool] = None
-    ):
-        query = db.query(Book)
-        
-        filters = []
-        if genre:
-            filters.append(Book.genre == genre)
-        if min_price:
-            filters.append(Book.price >= min_price)
-        if max_price:
-            filters.append(Book.price <= max_price)
-        if min_date:
-            filters.append(Book.published_date >= min_date)
-        if in_stock is not None:
-            if in_stock:
-                filters.append(Book.quantity > 0)
-            else:
-                filters.append(Book.quantity == 0)
-        
-        if filters:
-            query = query.filter(and_(*filters))
-        
-        return query.all()
-    
+        in_stock: Optional[bool] = None,
+        fields: Optional[Sequence[str]] = None
+    ):
+        stmt = _books_by_filters_stmt(genre, min_price, max_price, min_date, in_stock, fields)
+        return _row_dicts(db.execute(stmt))
+
+    # Потоковые варианты неограниченных выборок: строки читаются серверным
+    # курсором пачками по batch_size, в памяти всегда не больше одной пачки
+    @staticmethod
+    def stream_books_by_filters(
+        db: Session,
+        genre: Optional[str] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        min_date: Optional[date] = None,
+        in_stock: Optional[bool] = None,
+        fields: Optional[Sequence[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ):
+        stmt = _books_by_filters_stmt(genre, min_price, max_price, min_date, in_stock, fields)
+        result = db.execute(stmt, execution_options={"yield_per": batch_size})
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
     # JOIN запрос: книги с их заказами
     @staticmethod
     def get_books_with_orders(db: Session, skip: int = 0, limit: int = 100):
-        return db.query(Book).join(Order).offset(skip).limit(limit).all()
-    
+        return db.execute(_books_with_orders_stmt(skip, limit)).scalars().all()
+
     # GROUP BY: статистика по жанрам
     @staticmethod
-    def get_genre_statistics(db: Session):
-        return db.query(
-            Book.genre,
-            func.count(Book.id).label('book_count'),
-            func.sum(Book.quantity).label('total_quantity'),
-            func.avg(Book.price).label('avg_price')
-        ).filter(Book.genre.isnot(None)).group_by(Book.genre).all()
-    
+    def get_genre_statistics(db: Session, max_age: int = GENRE_STATS_MAX_AGE, refresh: bool = False):
+        """Возвращает (refreshed_at, строки по жанрам)"""
+        refreshed_at, stale = db.execute(_genre_stats_state_stmt(max_age)).one()
+        if refresh or stale:
+            if BookCRUD.refresh_genre_statistics(db, wait=refresh):
+                refreshed_at = db.execute(_genre_stats_state_stmt(max_age)).one()[0]
+        return refreshed_at, db.execute(_genre_statistics_stmt()).all()
+
+    @staticmethod
+    def refresh_genre_statistics(db: Session, wait: bool = False):
+        """
+        Пересчитывает genre_stats_mv. Без wait при уже идущем пересчете
+        сразу возвращает False — читатели получат текущие данные.
+        """
+        if wait:
+            db.execute(_GENRE_STATS_LOCK)
+        elif not db.execute(_GENRE_STATS_TRY_LOCK).scalar():
+            db.rollback()
+            return False
+        db.execute(_GENRE_STATS_REFRESH)
+        _invalidate_books(db)
+        db.commit()
+        return True
+
     # UPDATE с нетривиальным условием
     @staticmethod
     def apply_discount_to_genre(db: Session, genre: str, discount_percent: Decimal):
-        # Применяем скидку ко всем книгам определенного жанра
-        return db.query(Book).filter(
-            Book.genre == genre,
-            Book.price > 0,
-            Book.quantity > 0
-        ).update(
-            {Book.price: Book.price * (1 - discount_percent / 100)},
-            synchronize_session=False
-        )
-    
+        # Применяем скидку ко всем книгам определенного жанра пачками
+        return BookCRUD.reprice_genres(db, [genre], "percent", -discount_percent)
+
+    @staticmethod
+    def reprice_candidates(db: Session, genres: Sequence[str], after_id: int, batch_size: int = REPRICE_BATCH_SIZE):
+        return db.execute(_reprice_candidates_stmt(genres, after_id, batch_size)).scalars().all()
+
+    @staticmethod
+    def reprice_batch(db: Session, book_ids: Sequence[int], genres: Sequence[str], change_type: str, amount: Decimal):
+        """
+        Переоценивает book_ids, не дожидаясь строк, заблокированных другими
+        транзакциями. Возвращает (переоцененные id, пропущенные id);
+        commit выполняет вызывающий.
+        """
+        updated = db.execute(_reprice_stmt(book_ids, genres, change_type, amount)).scalars().all()
+        rest = set(book_ids).difference(updated)
+        skipped = db.execute(_reprice_pending_stmt(rest, genres)).scalars().all() if rest else []
+        _invalidate_books(db, updated)
+        return updated, skipped
+
+    @staticmethod
+    def reprice_genres(
+        db: Session,
+        genres: Sequence[str],
+        change_type: str,
+        amount: Decimal,
+        batch_size: int = REPRICE_BATCH_SIZE
+    ):
+        """
+        Переоценка без задания: пачки коммитятся по одной, пропущенные из-за
+        блокировок книги повторяются до REPRICE_MAX_RETRIES раз.
+        Возвращает (число переоцененных книг, id так и не переоцененных).
+        """
+        updated_count, after_id, skipped = 0, 0, []
+        while book_ids := BookCRUD.reprice_candidates(db, genres, after_id, batch_size):
+            updated, locked = BookCRUD.reprice_batch(db, book_ids, genres, change_type, amount)
+            db.commit()
+            updated_count, after_id, skipped = updated_count + len(updated), book_ids[-1], skipped + locked
+        for attempt in range(1, REPRICE_MAX_RETRIES + 1):
+            if not skipped:
+                break
+            time.sleep(REPRICE_RETRY_DELAY * attempt)
+            pending, skipped = skipped, []
+            for start in range(0, len(pending), batch_size):
+                updated, locked = BookCRUD.reprice_batch(
+                    db, pending[start:start + batch_size], genres, change_type, amount
+                )
+                db.commit()
+                updated_count, skipped = updated_count + len(updated), skipped + locked
+        return updated_count, skipped
+
     # Полнотекстовый поиск по JSON полю
     @staticmethod
-    def search_in_metadata(db: Session, search_term: str):
-        # Используем PostgreSQL операторы для поиска в JSON
-        from sqlalchemy import text
-        query = text("""
-            SELECT * FROM books 
-            WHERE metadata_info::text LIKE :pattern
-            OR EXISTS (
-                SELECT 1 FROM json_each_text(metadata_info) 
-                WHERE value LIKE :pattern
-            )
-        """)
-        return db.execute(query, {"pattern": f"%{search_term}%"}).fetchall()
+    def search_in_metadata(db: Session, search_term: str, fields: Optional[Sequence[str]] = None):
+        return _row_dicts(db.execute(_metadata_search_stmt(fields), {"pattern": f"%{search_term}%"}))
+
+    # Структурированный запрос по metadata_info через GIN-индекс
+    @staticmethod
+    def query_metadata(
+        db: Session,
+        contains: Optional[Dict[str, Any]] = None,
+        keys: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        ranges: Optional[List[Tuple[str, Optional[float], Optional[float]]]] = None,
+        skip: int = 0,
+        limit: int = 100,
+        fields: Optional[Sequence[str]] = None
+    ):
+        stmt = _metadata_query_stmt(contains, keys, tags, ranges, skip, limit, fields)
+        return _row_dicts(db.execute(stmt))
+
+    @staticmethod
+    def suggest(db: Session, term: str, limit: int = 8):
+        """
+        Подсказки {"titles": [...], "authors": [...]} для строки term и флаг
+        timed_out: при превышении SUGGEST_TIMEOUT_MS отдается то, что успели
+        найти, и такой неполный ответ не кешируется.
+        """
+        found = {field: [] for field, _ in _SUGGEST_FIELDS}
+        timed_out = False
+        try:
+            db.execute(_SUGGEST_TIMEOUT)
+            _merge_suggestions(found, db.execute(_suggest_prefix_stmt(term, limit)).all(), limit)
+            if _needs_trgm(term, found, limit):
+                _merge_suggestions(found, db.execute(_suggest_trgm_stmt(term, limit)).all(), limit)
+        except DBAPIError as e:
+            if not _is_statement_timeout(e):
+                raise
+            timed_out = True
+        finally:
+            db.rollback()
+        return found, timed_out
+
+    @staticmethod
+    def search_books_fulltext(
+        db: Session, search_term: str, skip: int = 0, limit: int = 20, fields: Optional[Sequence[str]] = None
+    ):
+        """Полнотекстовый поиск: строки книги с rank, title_highlight и snippet"""
+        return _row_dicts(db.execute(_fulltext_stmt(search_term, skip, limit, fields)))
+
+    @staticmethod
+    def stream_search_in_metadata(
+        db: Session, search_term: str, fields: Optional[Sequence[str]] = None, batch_size: int = STREAM_BATCH_SIZE
+    ):
+        result = db.execute(
+            _metadata_search_stmt(fields), {"pattern": f"%{search_term}%"}, execution_options={"yield_per": batch_size}
+        )
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+    @staticmethod
+    def stream_search_books_fulltext(
+        db: Session, search_term: str, fields: Optional[Sequence[str]] = None, batch_size: int = STREAM_BATCH_SIZE
+    ):
+        result = db.execute(_fulltext_stmt(search_term, fields=fields), execution_options={"yield_per": batch_size})
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
 
 class OrderCRUD:
     @staticmethod
     def create_order(db: Session, order: OrderCreate):
-        # Получаем книгу для расчета цены
-        book = db.query(Book).filter(Book.id == order.book_id).first()
-        if not book:
-            return None
-        
-        # Проверяем наличие
-        if book.quantity < order.quantity:
-            return None
-        
-        # Создаем заказ
-        total_price = book.price * order.quantity
-        db_order = Order(
-            **order.dict(),
-            total_price=total_price
-        )
-        
-        # Обновляем количество книг
-        book.quantity -= order.quantity
-        
-        db.add(db_order)
+        # Списание и вставка атомарны: None, если книги нет или не хватает запаса
+        db_order = db.execute(_place_order_stmt(order)).scalars().first()
+        if db_order is not None:
+            # Заказ списал quantity у книги
+            _invalidate_books(db, [db_order.book_id])
         db.commit()
-        db.refresh(db_order)
         return db_order
-    
+
     @staticmethod
-    def get_orders_by_customer(db: Session, email: str):
-        return db.query(Order).filter(Order.customer_email == email).all()
-    
+    def get_orders_by_customer(db: Session, email: str, date_from: Optional[date] = None, date_to: Optional[date] = None):
+        return db.execute(_customer_orders_stmt(email, date_from, date_to)).scalars().all()
+
     @staticmethod
     def get_daily_sales(db: Session, target_date: date):
-        return db.query(
-            func.sum(Order.total_price).label('total_sales'),
-            func.count(Order.id).label('order_count')
-        ).filter(func.date(Order.order_date) == target_date).first()
-
-
-    @staticmethod
-    def search_books_fulltext(db: Session, search_term: str):
-        """Полнотекстовый поиск с использованием pg_trgm"""
-        from sqlalchemy import func, or_
-        
-        # Используем триграммный поиск
-        return db.query(Book).filter(
-            or_(
-                func.similarity(Book.title, search_term) > 0.3,
-                func.similarity(Book.author, search_term) > 0.3,
-                Book.description.ilike(f"%{search_term}%"),
-                Book.metadata_info.cast(sa.Text).ilike(f"%{search_term}%")
-            )
-        ).order_by(
-            func.similarity(Book.title, search_term).desc()
-        ).all()
\ No newline at end of file
+        return db.execute(_daily_sales_stmt(target_date)).first()
+
+    @staticmethod
+    def get_daily_sales_range(db: Session, date_from: date, date_to: date):
+        return db.execute(_daily_sales_range_stmt(date_from, date_to)).all()
+
+    @staticmethod
+    def backfill_daily_sales(db: Session):
+        """Пересобирает daily_sales по orders; возвращает количество строк сводки"""
+        lock, clear, fill = _DAILY_SALES_BACKFILL
+        db.execute(lock)
+        db.execute(clear)
+        inserted = db.execute(fill).rowcount
+        db.commit()
+        return inserted
+
+    @staticmethod
+    def create_partitions(db: Session, date_from: date, date_to: date) -> List[str]:
+        """Создает недостающие месячные партиции orders; возвращает имена созданных"""
+        created = db.execute(_CREATE_ORDER_PARTITIONS, {"date_from": date_from, "date_to": date_to}).scalars().all()
+        db.commit()
+        return created
+
+    @staticmethod
+    def list_partitions(db: Session):
+        return db.execute(_ORDER_PARTITIONS).mappings().all()
+
+    @staticmethod
+    def detach_partition(db: Session, name: str, archive_schema: Optional[str] = None, drop: bool = False):
+        """
+        Отсоединяет партицию от orders. Таблица остается в archive_schema
+        (или на месте) либо удаляется при drop=True. Сводки book_stats и
+        daily_sales не меняются.
+        """
+        quote = db.get_bind().dialect.identifier_preparer.quote
+        db.execute(_PARTITION_LOCK_TIMEOUT)
+        db.execute(text(f"ALTER TABLE orders DETACH PARTITION {quote(name)}"))
+        if drop:
+            db.execute(text(f"DROP TABLE {quote(name)}"))
+        elif archive_schema:
+            db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {quote(archive_schema)}"))
+            db.execute(text(f"ALTER TABLE {quote(name)} SET SCHEMA {quote(archive_schema)}"))
+        db.commit()
+
+
+# Пересчет book_stats с нуля. SHARE-блокировка orders не дает триггеру
+# добавить заказ, который пересчет уже не увидит.
+_BOOK_STATS_BACKFILL = [
+    text("LOCK TABLE orders IN SHARE MODE"),
+    text("""
+        INSERT INTO book_stats (book_id, total_orders, total_revenue)
+        SELECT book_id, count(*), coalesce(sum(total_price), 0)
+        FROM orders
+        GROUP BY book_id
+        ON CONFLICT (book_id) DO UPDATE
+        SET total_orders = EXCLUDED.total_orders,
+            total_revenue = EXCLUDED.total_revenue
+    """),
+    text("""
+        UPDATE book_stats SET total_orders = 0, total_revenue = 0
+        WHERE NOT EXISTS (SELECT 1 FROM orders WHERE orders.book_id = book_stats.book_id)
+    """),
+]
+
+# Пересборка дневной сводки daily_sales с нуля, под той же блокировкой orders
+_DAILY_SALES_BACKFILL = [
+    text("LOCK TABLE orders IN SHARE MODE"),
+    text("DELETE FROM daily_sales"),
+    text(f"""
+        INSERT INTO daily_sales (sales_date, status, shard, total_sales, order_count)
+        SELECT order_date, coalesce(status, 'pending'), id % {DAILY_SALES_SHARDS},
+               coalesce(sum(total_price), 0), count(*)
+        FROM orders
+        GROUP BY 1, 2, 3
+    """),
+]
+
+# Месячные партиции orders (см. ORDERS_PARTITIONS_SQL в app/models/book.py)
+_CREATE_ORDER_PARTITIONS = text("SELECT orders_create_partitions(:date_from, :date_to)")
+_ORDER_PARTITIONS = text("""
+    SELECT partition.relname AS name,
+           pg_get_expr(partition.relpartbound, partition.oid) AS bound,
+           substring(pg_get_expr(partition.relpartbound, partition.oid) FROM 'TO \\(''([0-9-]+)''\\)')::date AS upper_bound,
+           greatest(partition.reltuples, 0)::bigint AS estimated_rows,
+           pg_total_relation_size(partition.oid) AS total_bytes
+    FROM pg_inherits
+    JOIN pg_class partition ON partition.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'orders'::regclass
+    ORDER BY upper_bound NULLS LAST, name
+""")
+# DETACH ждет ACCESS EXCLUSIVE на orders: не дольше 5 с, чтобы не копить очередь заказов
+_PARTITION_LOCK_TIMEOUT = text("SET LOCAL lock_timeout = '5s'")
+
+class BookStatCRUD:
+    @staticmethod
+    def get_stats(db: Session, book_id: int):
+        return db.execute(select(BookStat).where(BookStat.book_id == book_id)).scalars().first()
+
+    @staticmethod
+    def get_stats_bulk(db: Session, book_ids: List[int]):
+        return db.execute(select(BookStat).where(BookStat.book_id.in_(book_ids))).scalars().all()
+
+    @staticmethod
+    def backfill(db: Session):
+        """Возвращает количество книг, для которых записана статистика"""
+        lock, upsert, reset = _BOOK_STATS_BACKFILL
+        db.execute(lock)
+        updated = db.execute(upsert).rowcount
+        db.execute(reset)
+        db.commit()
+        return updated
+
+
+# Асинхронные версии CRUD для AsyncSession (asyncpg).
+# Используются роутерами; синхронные остаются для скриптов.
+
+class AsyncBookCRUD:
+    # Чтения ниже идут через book_cache: книга — BookInDB, списки — словари строк
+
+    @staticmethod
+    async def get_book(db: AsyncSession, book_id: int):
+        async def load():
+            book = (await db.execute(_book_by_id(book_id))).scalars().first()
+            return BookInDB.model_validate(book) if book is not None else None
+        return await _read_through(db, book_cache.book_key(book_id), load)
+
+    @staticmethod
+    async def get_books(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False,
+        fields: Optional[Sequence[str]] = None
+    ):
+        async def load():
+            return _row_dicts(await db.execute(_books_stmt(skip, limit, sort_by, sort_desc, fields)))
+        return await _read_through(db, book_cache.query_key("books", skip, limit, sort_by, sort_desc, fields), load)
+
+    @staticmethod
+    async def get_book_versions(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False
+    ):
+        async def load():
+            stmt = _book_versions_stmt(skip, limit, sort_by, sort_desc)
+            return [tuple(row) for row in (await db.execute(stmt)).all()]
+        return await _read_through(db, book_cache.query_key("book_versions", skip, limit, sort_by, sort_desc), load)
+
+    @staticmethod
+    async def get_books_keyset(
+        db: AsyncSession,
+        sort_by: Optional[str] = None,
+        sort_desc: bool = False,
+        after: Optional[Tuple[Any, int]] = None,
+        limit: int = 100
+    ):
+        async def load():
+            books = []
+            for stmt in _keyset_segments(sort_by, sort_desc, after):
+                if len(books) >= limit:
+                    break
+                books.extend(_row_dicts(await db.execute(stmt.limit(limit - len(books)))))
+            return books
+        return await _read_through(db, book_cache.query_key("keyset", sort_by, sort_desc, after, limit), load)
+
+    @staticmethod
+    async def get_books_by_author(db: AsyncSession, author: str):
+        result = await db.execute(select(Book).where(Book.author.ilike(f"%{author}%")))
+        return result.scalars().all()
+
+    @staticmethod
+    async def create_book(db: AsyncSession, book: BookCreate):
+        db_book = Book(**book.dict())
+        db.add(db_book)
+        await db.flush()
+        _invalidate_books(db, [db_book.id])
+        await db.commit()
+        await db.refresh(db_book)
+        return db_book
+
+    @staticmethod
+    async def upsert_books(db: AsyncSession, rows: List[dict]):
+        if not rows:
+            return 0, 0
+        returned_rows = (await db.execute(_upsert_books_stmt(rows))).all()
+        _invalidate_books(db, [row.id for row in returned_rows])
+        return _count_upserted(returned_rows)
+
+    @staticmethod
+    async def update_book(db: AsyncSession, book_id: int, book_update: BookUpdate):
+        db_book = (await db.execute(_book_by_id(book_id))).scalars().first()
+        if db_book:
+            update_data = book_update.dict(exclude_unset=True)
+            for key, value in update_data.items():
+                setattr(db_book, key, value)
+            db_book.version = Book.version + 1
+            _invalidate_books(db, [book_id])
+            await db.commit()
+            await db.refresh(db_book)
+        return db_book
+
+    @staticmethod
+    async def delete_book(db: AsyncSession, book_id: int):
+        db_book = (await db.execute(_book_by_id(book_id))).scalars().first()
+        if db_book:
+            await db.delete(db_book)
+            _invalidate_books(db, [book_id])
+            await db.commit()
+        return db_book
+
+    @staticmethod
+    async def get_books_by_filters(
+        db: AsyncSession,
+        genre: Optional[str] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        min_date: Optional[date] = None,
+        in_stock: Optional[bool] = None,
+        fields: Optional[Sequence[str]] = None
+    ):
+        # Без LIMIT: результат может быть всем каталогом, поэтому в кеш не попадает
+        stmt = _books_by_filters_stmt(genre, min_price, max_price, min_date, in_stock, fields)
+        return _row_dicts(await db.execute(stmt))
+
+    @staticmethod
+    async def stream_books_by_filters(
+        db: AsyncSession,
+        genre: Optional[str] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        min_date: Optional[date] = None,
+        in_stock: Optional[bool] = None,
+        fields: Optional[Sequence[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ):
+        stmt = _books_by_filters_stmt(genre, min_price, max_price, min_date, in_stock, fields)
+        result = await db.stream(stmt, execution_options={"yield_per": batch_size})
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+    @staticmethod
+    async def get_books_with_orders(db: AsyncSession, skip: int = 0, limit: int = 100):
+        return (await db.execute(_books_with_orders_stmt(skip, limit))).scalars().all()
+
+    @staticmethod
+    async def get_genre_statistics(db: AsyncSession, max_age: int = GENRE_STATS_MAX_AGE, refresh: bool = False):
+        async def load():
+            refreshed_at, stale = (await db.execute(_genre_stats_state_stmt(max_age))).one()
+            if refresh or stale:
+                if await AsyncBookCRUD.refresh_genre_statistics(db, wait=refresh):
+                    refreshed_at = (await db.execute(_genre_stats_state_stmt(max_age))).one()[0]
+            return refreshed_at, [row._asdict() for row in (await db.execute(_genre_statistics_stmt())).all()]
+        if refresh:
+            return await load()
+        return await _read_through(db, book_cache.query_key("genre_stats", max_age), load)
+
+    @staticmethod
+    async def refresh_genre_statistics(db: AsyncSession, wait: bool = False):
+        if wait:
+            await db.execute(_GENRE_STATS_LOCK)
+        elif not (await db.execute(_GENRE_STATS_TRY_LOCK)).scalar():
+            await db.rollback()
+            return False
+        await db.execute(_GENRE_STATS_REFRESH)
+        _invalidate_books(db)
+        await db.commit()
+        return True
+
+    @staticmethod
+    async def apply_discount_to_genre(db: AsyncSession, genre: str, discount_percent: Decimal):
+        return await AsyncBookCRUD.reprice_genres(db, [genre], "percent", -discount_percent)
+
+    @staticmethod
+    async def reprice_candidates(
+        db: AsyncSession, genres: Sequence[str], after_id: int, batch_size: int = REPRICE_BATCH_SIZE
+    ):
+        return (await db.execute(_reprice_candidates_stmt(genres, after_id, batch_size))).scalars().all()
+
+    @staticmethod
+    async def reprice_batch(
+        db: AsyncSession, book_ids: Sequence[int], genres: Sequence[str], change_type: str, amount: Decimal
+    ):
+        updated = (await db.execute(_reprice_stmt(book_ids, genres, change_type, amount))).scalars().all()
+        rest = set(book_ids).difference(updated)
+        skipped = (await db.execute(_reprice_pending_stmt(rest, genres))).scalars().all() if rest else []
+        _invalidate_books(db, updated)
+        return updated, skipped
+
+    @staticmethod
+    async def reprice_genres(
+        db: AsyncSession,
+        genres: Sequence[str],
+        change_type: str,
+        amount: Decimal,
+        batch_size: int = REPRICE_BATCH_SIZE
+    ):
+        updated_count, after_id, skipped = 0, 0, []
+        while book_ids := await AsyncBookCRUD.reprice_candidates(db, genres, after_id, batch_size):
+            updated, locked = await AsyncBookCRUD.reprice_batch(db, book_ids, genres, change_type, amount)
+            await db.commit()
+            updated_count, after_id, skipped = updated_count + len(updated), book_ids[-1], skipped + locked
+        for attempt in range(1, REPRICE_MAX_RETRIES + 1):
+            if not skipped:
+                break
+            await asyncio.sleep(REPRICE_RETRY_DELAY * attempt)
+            pending, skipped = skipped, []
+            for start in range(0, len(pending), batch_size):
+                updated, locked = await AsyncBookCRUD.reprice_batch(
+                    db, pending[start:start + batch_size], genres, change_type, amount
+                )
+                await db.commit()
+                updated_count, skipped = updated_count + len(updated), skipped + locked
+        return updated_count, skipped
+
+    @staticmethod
+    async def search_in_metadata(db: AsyncSession, search_term: str, fields: Optional[Sequence[str]] = None):
+        return _row_dicts(await db.execute(_metadata_search_stmt(fields), {"pattern": f"%{search_term}%"}))
+
+    @staticmethod
+    async def query_metadata(
+        db: AsyncSession,
+        contains: Optional[Dict[str, Any]] = None,
+        keys: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        ranges: Optional[List[Tuple[str, Optional[float], Optional[float]]]] = None,
+        skip: int = 0,
+        limit: int = 100,
+        fields: Optional[Sequence[str]] = None
+    ):
+        stmt = _metadata_query_stmt(contains, keys, tags, ranges, skip, limit, fields)
+        return _row_dicts(await db.execute(stmt))
+
+    @staticmethod
+    async def suggest(db: AsyncSession, term: str, limit: int = 8):
+        found = {field: [] for field, _ in _SUGGEST_FIELDS}
+        timed_out = False
+        try:
+            await db.execute(_SUGGEST_TIMEOUT)
+            _merge_suggestions(found, (await db.execute(_suggest_prefix_stmt(term, limit))).all(), limit)
+            if _needs_trgm(term, found, limit):
+                _merge_suggestions(found, (await db.execute(_suggest_trgm_stmt(term, limit))).all(), limit)
+        except DBAPIError as e:
+            if not _is_statement_timeout(e):
+                raise
+            timed_out = True
+        finally:
+            # SET LOCAL действует до конца транзакции: закрываем ее сразу
+            await db.rollback()
+        return found, timed_out
+
+    @staticmethod
+    async def search_books_fulltext(
+        db: AsyncSession, search_term: str, skip: int = 0, limit: int = 20, fields: Optional[Sequence[str]] = None
+    ):
+        return _row_dicts(await db.execute(_fulltext_stmt(search_term, skip, limit, fields)))
+
+    @staticmethod
+    async def stream_search_in_metadata(
+        db: AsyncSession, search_term: str, fields: Optional[Sequence[str]] = None, batch_size: int = STREAM_BATCH_SIZE
+    ):
+        result = await db.stream(
+            _metadata_search_stmt(fields), {"pattern": f"%{search_term}%"}, execution_options={"yield_per": batch_size}
+        )
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+    @staticmethod
+    async def stream_search_books_fulltext(
+        db: AsyncSession, search_term: str, fields: Optional[Sequence[str]] = None, batch_size: int = STREAM_BATCH_SIZE
+    ):
+        result = await db.stream(
+            _fulltext_stmt(search_term, fields=fields), execution_options={"yield_per": batch_size}
+        )
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+class AsyncOrderCRUD:
+    @staticmethod
+    async def create_order(db: AsyncSession, order: OrderCreate):
+        db_order = (await db.execute(_place_order_stmt(order))).scalars().first()
+        if db_order is not None:
+            _invalidate_books(db, [db_order.book_id])
+        await db.commit()
+        return db_order
+
+    @staticmethod
+    async def get_orders_by_customer(
+        db: AsyncSession, email: str, date_from: Optional[date] = None, date_to: Optional[date] = None
+    ):
+        return (await db.execute(_customer_orders_stmt(email, date_from, date_to))).scalars().all()
+
+    @staticmethod
+    async def get_daily_sales(db: AsyncSession, target_date: date):
+        return (await db.execute(_daily_sales_stmt(target_date))).first()
+
+    @staticmethod
+    async def get_daily_sales_range(db: AsyncSession, date_from: date, date_to: date):
+        return (await db.execute(_daily_sales_range_stmt(date_from, date_to))).all()
+
+    @staticmethod
+    async def create_partitions(db: AsyncSession, date_from: date, date_to: date) -> List[str]:
+        created = (
+            await db.execute(_CREATE_ORDER_PARTITIONS, {"date_from": date_from, "date_to": date_to})
+        ).scalars().all()
+        await db.commit()
+        return created
+
+class AsyncBookStatCRUD:
+    @staticmethod
+    async def get_stats(db: AsyncSession, book_id: int):
+        return (await db.execute(select(BookStat).where(BookStat.book_id == book_id))).scalars().first()
+
+    @staticmethod
+    async def get_stats_bulk(db: AsyncSession, book_ids: List[int]):
+        return (await db.execute(select(BookStat).where(BookStat.book_id.in_(book_ids)))).scalars().all()
+
+class AsyncRepricingJobCRUD:
+    @staticmethod
+    async def create_job(db: AsyncSession, job: RepricingCreate):
+        db_job = RepricingJob(
+            genres=list(dict.fromkeys(job.genres)),
+            change_type=job.change_type,
+            amount=job.amount,
+            batch_size=job.batch_size or REPRICE_BATCH_SIZE,
+        )
+        db.add(db_job)
+        await db.commit()
+        await db.refresh(db_job)
+        return db_job
+
+    @staticmethod
+    async def get_job(db: AsyncSession, job_id: int):
+        return (await db.execute(select(RepricingJob).where(RepricingJob.id == job_id))).scalars().first()
+
+    @staticmethod
+    async def lock_job(db: AsyncSession, job_id: int):
+        """
+        Строка задания блокируется на время пачки: два исполнителя одного
+        задания (например, после resume) обрабатывают пачки по очереди
+        и каждый видит прогресс другого.
+        """
+        stmt = select(RepricingJob).where(RepricingJob.id == job_id).with_for_update().execution_options(
+            populate_existing=True
+        )
+        return (await db.execute(stmt)).scalars().first()
@@ -0,0 +1,55 @@
+"""
+ETag и условные GET (If-None-Match -> 304).
+
+Для книг тег строится из (id, version): версия увеличивается каждой записью,
+поэтому проверка не требует сериализации тела. Для списков — хеш пар
+(id, version) страницы, которые читаются отдельным легким запросом.
+Для статистики продаж — хеш значений счетчиков. Статистика жанров меняется
+только пересчетом материализованного представления, поэтому ее тег —
+время пересчета refreshed_at.
+"""
+import hashlib
+from typing import Any, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: Any) -> str:
+    """Сильный ETag: хеш от частей, которые определяют представление"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def book_etag(book) -> str:
+    return make_etag("book", book.id, book.version)
+
+
+def book_list_etag(versions: Iterable, fields: Optional[Tuple[str, ...]] = None) -> str:
+    """versions — пары (id, version) в порядке выдачи; fields — набор полей ответа"""
+    return make_etag("books", fields, *(tuple(row) for row in versions))
+
+
+def stats_etag(stats: Iterable) -> str:
+    return make_etag("stats", *(
+        (stat.book_id, stat.total_orders, str(stat.total_revenue), str(stat.average_rating)) for stat in stats
+    ))
+
+
+def genre_stats_etag(refreshed_at) -> str:
+    return make_etag("genre_stats", refreshed_at.isoformat() if refreshed_at else None)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/"x" совпадает с "x".
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,121 @@
+"""
+Разбор потокового тела запроса для массовой загрузки книг.
+
+Поддерживаются NDJSON (одна JSON-запись на строку) и CSV с заголовком.
+Записи валидируются через BookCreate и отдаются пачками, чтобы загрузка
+в базу шла батчами, а не по одной строке.
+"""
+import csv
+import json
+from typing import AsyncIterator, List, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas.book import BookCreate
+
+# Сколько ошибок валидации возвращать на один батч
+MAX_ERRORS_PER_BATCH = 20
+
+
+def _decode(line: bytes):
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError as e:
+        return e
+
+
+async def _iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Разбивает поток байтов на строки, не держа все тело в памяти.
+    Строка не в UTF-8 отдается как UnicodeDecodeError и отклоняется
+    отдельно, не прерывая загрузку.
+    """
+    buffer = b""
+    line_no = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, _decode(line)
+    if buffer:
+        yield line_no + 1, _decode(buffer)
+
+
+async def _iter_ndjson(stream) -> AsyncIterator[Tuple[int, object]]:
+    async for line_no, line in _iter_lines(stream):
+        if isinstance(line, UnicodeDecodeError):
+            yield line_no, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, e
+
+
+async def _iter_csv(stream) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    record, record_line = "", 0
+    async for line_no, line in _iter_lines(stream):
+        if isinstance(line, UnicodeDecodeError):
+            # Запись, в которую попала битая строка, отклоняется целиком
+            yield record_line or line_no, line
+            record, record_line = "", 0
+            continue
+        # Поле в кавычках может содержать перевод строки: копим строки,
+        # пока количество кавычек в записи не станет четным
+        record = f"{record}\n{line}" if record else line
+        record_line = record_line or line_no
+        if record.count('"') % 2:
+            continue
+        text, line_no, record, record_line = record, record_line, "", 0
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, ValueError(f"ожидалось {len(header)} полей, получено {len(values)}")
+            continue
+
+        # Пустые ячейки считаем отсутствующими полями, чтобы сработали значения по умолчанию
+        row = {name: value for name, value in zip(header, values) if value != ""}
+        if row.get("metadata_info"):
+            try:
+                row["metadata_info"] = json.loads(row["metadata_info"])
+            except json.JSONDecodeError as e:
+                yield line_no, e
+                continue
+        yield line_no, row
+
+
+async def iter_book_batches(stream, fmt: str, batch_size: int):
+    """
+    Отдает пачки (rows, errors): rows — провалидированные словари для вставки,
+    errors — список (номер строки, текст ошибки) для отклоненных записей.
+    """
+    records = _iter_csv(stream) if fmt == "csv" else _iter_ndjson(stream)
+    rows: List[dict] = []
+    errors: List[Tuple[int, str]] = []
+
+    async for line_no, record in records:
+        if isinstance(record, Exception):
+            errors.append((line_no, str(record)))
+        else:
+            try:
+                rows.append(BookCreate.model_validate(record).model_dump())
+            except ValidationError as e:
+                errors.append((line_no, "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+                )))
+
+        if len(rows) + len(errors) >= batch_size:
+            yield rows, errors
+            rows, errors = [], []
+
+    if rows or errors:
+        yield rows, errors
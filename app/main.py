@@ -1,15 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-from app.database import engine, Base
+from fastapi.responses import PlainTextResponse
+from app.database import pool_status, replica_status
+from app.cache import cache_stats
+from app.metrics import MetricsMiddleware, registry
+from app.slow_queries import slow_query_report
 from app import models  # ensure model modules are imported so SQLAlchemy registers them
 from app.routers import books
+from app.startup import lifespan
 
-# Создаем таблицы в базе данных
-# Use Base from `app.database` (models package doesn't export Base).
-Base.metadata.create_all(bind=engine)
-
+# Схема создается только миграциями (alembic upgrade head); при старте
+# воркер проверяет ревизию и прогревает пул (см. app/startup.py)
 app = FastAPI(
+    lifespan=lifespan,
     title="Library Management API",
     description="REST API для управления библиотекой книг",
     version="1.0.0",
@@ -26,6 +29,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики по маршрутам: время, SQL, размер ответа (GET /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Подключаем роутеры
 app.include_router(books.router)
 
@@ -36,6 +42,7 @@ def read_root():
         "docs": "/docs",
         "endpoints": {
             "books": "/books/",
+            "books_cursor": "/books/cursor/",
             "books_with_orders": "/books/with-orders/",
             "genre_statistics": "/books/statistics/genre/",
             "metadata_search": "/books/search/metadata/?q=search_term",
@@ -45,4 +52,32 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "Library Management API"}
\ No newline at end of file
+    return {"status": "healthy", "service": "Library Management API"}
+
+@app.get("/health/pool")
+def pool_health():
+    """Состояние пулов соединений: занятые, свободные, overflow и время ожидания"""
+    return pool_status()
+
+@app.get("/health/replicas")
+def replicas_health():
+    """Реплики для чтения: отставание, доступность, число чтений, ушедших на primary"""
+    return replica_status()
+
+@app.get("/health/cache")
+def cache_health():
+    """Счетчики кешей: попадания, промахи, вытеснения, поколение инвалидации"""
+    return cache_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Метрики в текстовом формате Prometheus: маршруты, SQL, пулы соединений, кеши"""
+    return PlainTextResponse(
+        registry.render(pools=pool_status(), caches=cache_stats()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/debug/slow-queries")
+def slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Последние медленные запросы: SQL, параметры, маршрут, метод CRUD и EXPLAIN (ANALYZE, BUFFERS)"""
+    return slow_query_report(limit)
@@ -0,0 +1,91 @@
+"""
+Структурированные запросы к metadata_info.
+
+Параметры запроса разбираются здесь и превращаются в условия, которые
+обслуживает GIN-индекс ix_books_metadata_info_gin (класс jsonb_ops):
+  - contains  — JSON-объект, проверяется через @>;
+  - has_key   — наличие ключа верхнего уровня, оператор ?;
+  - tag       — метки из массива tags, сводятся к @> {"tags": [...]};
+  - range     — "ключ:от:до" для числовых полей. Для ключей с B-tree
+                индексом по выражению (INDEXED_NUMERIC_KEYS) это сравнение
+                metadata_info -> 'ключ' с jsonb-числами, для остальных —
+                jsonpath для оператора @?.
+
+GIN не умеет сравнивать на больше/меньше: для @? с диапазоном он отбирает
+лишь строки, где ключ есть, поэтому частые числовые ключи индексируются
+отдельно.
+"""
+import json
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Ключи допускаются только в виде идентификаторов: они подставляются в jsonpath
+KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+Range = Tuple[str, Optional[float], Optional[float]]
+
+# Числовые ключи с индексами ix_books_metadata_<ключ> по metadata_info -> 'ключ'
+INDEXED_NUMERIC_KEYS = ("pages", "rating")
+
+
+class InvalidMetadataQuery(ValueError):
+    """Параметр структурированного запроса не удалось разобрать"""
+
+
+def _check_key(key: str) -> str:
+    if not KEY_PATTERN.match(key):
+        raise InvalidMetadataQuery(f"Недопустимое имя ключа: {key!r}")
+    return key
+
+
+def parse_contains(raw: Optional[str]) -> Dict:
+    if not raw:
+        return {}
+    try:
+        document = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise InvalidMetadataQuery(f"contains: некорректный JSON ({e.msg})") from e
+    if not isinstance(document, dict):
+        raise InvalidMetadataQuery("contains: ожидается JSON-объект")
+    return document
+
+
+def parse_keys(keys: Optional[List[str]]) -> List[str]:
+    return [_check_key(key) for key in keys or []]
+
+
+def _parse_bound(value: str, spec: str) -> Optional[float]:
+    if value == "":
+        return None
+    try:
+        bound = float(value)
+    except ValueError as e:
+        raise InvalidMetadataQuery(f"range: {value!r} не число в {spec!r}") from e
+    if not math.isfinite(bound):
+        raise InvalidMetadataQuery(f"range: недопустимая граница в {spec!r}")
+    return bound
+
+
+def parse_range(spec: str) -> Range:
+    """'pages:100:300' -> ('pages', 100.0, 300.0); пустая граница — без ограничения"""
+    parts = spec.split(":")
+    if len(parts) != 3:
+        raise InvalidMetadataQuery(f"range: ожидается 'ключ:от:до', получено {spec!r}")
+    key, low, high = parts
+    low, high = _parse_bound(low, spec), _parse_bound(high, spec)
+    if low is None and high is None:
+        raise InvalidMetadataQuery(f"range: не задана ни одна граница в {spec!r}")
+    if low is not None and high is not None and low > high:
+        raise InvalidMetadataQuery(f"range: нижняя граница больше верхней в {spec!r}")
+    return _check_key(key), low, high
+
+
+def range_jsonpath(key: str, low: Optional[float], high: Optional[float]) -> str:
+    """jsonpath-предикат для @?: '$.pages ? (@ >= 100 && @ <= 300)'"""
+    conditions = []
+    if low is not None:
+        conditions.append(f"@ >= {low!r}")
+    if high is not None:
+        conditions.append(f"@ <= {high!r}")
+    return f"$.{key} ? ({' && '.join(conditions)})"
@@ -0,0 +1,268 @@
+"""
+Метрики запросов в текстовом формате Prometheus (GET /metrics).
+
+MetricsMiddleware — чистый ASGI без BaseHTTPMiddleware: тело ответа не
+буферизуется, стриминговые ответы не ломаются. На каждый запрос
+фиксируются время, число SQL-запросов и время в базе, размер ответа.
+SQL считается обработчиками before/after_cursor_execute на движках из
+app/database.py; статистика запроса лежит в contextvar, поэтому
+запросы из пула потоков и из greenlet асинхронного движка попадают
+к своему HTTP-запросу.
+
+Метка route — шаблон пути ("/books/{book_id}"), а не сам путь:
+число временных рядов ограничено числом маршрутов.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Маршрут не найден (404 от роутера): один ряд на все такие пути
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Счетчики кешей и пулов, которые только растут; остальное — gauge
+_COUNTER_STATS = {"hits", "misses", "evictions", "expirations", "invalidations", "checkouts", "timeouts"}
+
+
+class RequestStats:
+    """SQL одного HTTP-запроса; после отправки ответа (finished) SQL фоновых задач считается отдельно"""
+    __slots__ = ("scope", "statements", "db_time", "finished")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = 0
+        self.db_time = 0.0
+        self.finished = False
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    """Кумулятивная гистограмма с фиксированными границами, как в Prometheus"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{_format(bound)}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {_format(self.sum)}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class RouteMetrics:
+    __slots__ = ("responses", "duration", "statements", "db_time", "size")
+
+    def __init__(self):
+        self.responses: Dict[int, int] = {}
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        # SQL вне HTTP-запросов: фоновые задания, скрипты
+        self.background_statements = 0
+        self.background_db_time = 0.0
+        # Неудачные проверки месячных партиций orders (app/startup.py)
+        self.partition_maintenance_failures = 0
+
+    def observe_request(self, method: str, route: str, status: int, duration: float,
+                        stats: RequestStats, size: int):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+            metrics.duration.observe(duration)
+            metrics.statements.observe(stats.statements)
+            metrics.db_time.observe(stats.db_time)
+            metrics.size.observe(size)
+
+    def observe_background_sql(self, elapsed: float):
+        with self._lock:
+            self.background_statements += 1
+            self.background_db_time += elapsed
+
+    def observe_partition_maintenance_failure(self):
+        with self._lock:
+            self.partition_maintenance_failures += 1
+
+    def render(self, pools: Optional[dict] = None, caches: Optional[dict] = None) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines: List[str] = []
+            lines += _header("http_requests_total", "counter", "HTTP-ответы по маршруту и статусу")
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+            for name, attr, help_text in (
+                ("http_request_duration_seconds", "duration", "Время обработки запроса"),
+                ("http_request_db_statements", "statements", "Число SQL-запросов на HTTP-запрос"),
+                ("http_request_db_seconds", "db_time", "Время выполнения SQL на HTTP-запрос"),
+                ("http_response_size_bytes", "size", "Размер тела ответа"),
+            ):
+                lines += _header(name, "histogram", help_text)
+                for (method, route), metrics in routes:
+                    lines.extend(getattr(metrics, attr).samples(name, _labels(method, route)))
+            lines += _header("db_background_statements_total", "counter", "SQL-запросы вне HTTP-запросов")
+            lines.append(f"db_background_statements_total {self.background_statements}")
+            lines += _header("db_background_seconds_total", "counter", "Время SQL вне HTTP-запросов")
+            lines.append(f"db_background_seconds_total {_format(self.background_db_time)}")
+            lines += _header("orders_partition_maintenance_failures_total", "counter",
+                             "Неудачные попытки создать партиции orders")
+            lines.append(f"orders_partition_maintenance_failures_total {self.partition_maintenance_failures}")
+
+        if pools:
+            lines += _stat_lines("db_pool", "engine", pools)
+        if caches:
+            lines += _stat_lines("cache", "cache", caches)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str) -> str:
+    return f'method="{method}",route="{_escape(route)}"'
+
+
+def _header(name: str, kind: str, help_text: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _stat_lines(prefix: str, label: str, groups: dict) -> List[str]:
+    """{'async': {'idle': 3, ...}} -> db_pool_idle{engine="async"} 3; нечисловые значения пропускаются"""
+    series: Dict[str, List[str]] = {}
+    for group, stats in sorted(groups.items()):
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}_total" if key in _COUNTER_STATS else f"{prefix}_{key}"
+            series.setdefault(name, []).append(f'{name}{{{label}="{group}"}} {_format(value)}')
+    lines = []
+    for name, samples in sorted(series.items()):
+        lines += _header(name, "counter" if name.endswith("_total") else "gauge", name.replace("_", " "))
+        lines += samples
+    return lines
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_query_start"].pop()
+    elapsed = time.perf_counter() - started
+    stats = _request_stats.get()
+    if stats is None or stats.finished:
+        registry.observe_background_sql(elapsed)
+    else:
+        stats.statements += 1
+        stats.db_time += elapsed
+
+
+def _handle_error(context):
+    # Запрос упал: снимаем его отметку времени, чтобы стек не рос
+    starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def track_sql(engine):
+    """Подключает подсчет SQL к синхронному движку (для async — к async_engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+_route_paths: Dict[object, str] = {}
+
+
+def route_path(scope) -> str:
+    """Шаблон пути запроса; роутер кладет в scope endpoint маршрута после сопоставления"""
+    if not _route_paths and "app" in scope:
+        _route_paths.update(
+            (route.endpoint, route.path) for route in scope["app"].routes if hasattr(route, "endpoint")
+        )
+    return _route_paths.get(scope.get("endpoint"), UNMATCHED_ROUTE)
+
+
+def current_request() -> Optional[Tuple[str, str]]:
+    """(HTTP-метод, шаблон маршрута) запроса, который сейчас выполняется, или None"""
+    stats = _request_stats.get()
+    if stats is None or stats.finished:
+        return None
+    return stats.scope["method"], route_path(stats.scope)
+
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware: метрики по шаблону маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status, size = 500, 0
+
+        def finish():
+            # Запрос закончен, когда ушел последний кусок тела; BackgroundTasks идут уже после
+            stats.finished = True
+            duration = time.perf_counter() - started
+            registry.observe_request(scope["method"], route_path(scope), status, duration, stats, size)
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            if not stats.finished:
+                finish()
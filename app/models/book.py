@@ -1,9 +1,24 @@
-from sqlalchemy import Column, Integer, String, Text, Date, JSON, ForeignKey, Index, Numeric, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, SmallInteger, String, Text, Date, DateTime, JSON, ForeignKey, Index, Numeric, Boolean, DDL, event
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import table, column
 from app.database import Base
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 import sqlalchemy as sa
 
+# Конфигурация полнотекстового поиска. 'simple' не делает стемминг и не
+# зависит от языка: в каталоге смешаны английские и русские тексты.
+SEARCH_CONFIG = "simple"
+
+# Поисковый вектор книги с весами: название (A), автор (B),
+# метки из metadata_info.tags (C), описание (D).
+# Тот же SQL применяется миграцией add_books_search_vector.
+BOOK_SEARCH_VECTOR_SQL = f"""
+setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(title, '')), 'A') ||
+setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(author, '')), 'B') ||
+setweight(jsonb_to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(metadata_info -> 'tags', '[]'::jsonb), '["string"]'), 'C') ||
+setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'D')
+"""
+
 class Book(Base):
     __tablename__ = "books"
     
@@ -19,23 +34,48 @@ class Book(Base):
     
     # JSON поле для дополнительных метаданных
     metadata_info = Column(JSONB, nullable=True, default=dict)
+
+    # Версия строки для ETag: увеличивается каждой записью в книгу
+    # (update_book, скидка, заказ, upsert)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    # Хранимый поисковый вектор; вычисляется базой, в ORM не загружается
+    search_vector = deferred(Column(TSVECTOR, Computed(BOOK_SEARCH_VECTOR_SQL, persisted=True)))
     
     # Связь с заказами
     orders = relationship("Order", back_populates="book")
     
-    # GIN индекс для полнотекстового поиска по JSON полю
+    # GIN индексы для поиска по JSON полю и по поисковому вектору,
+    # B-tree по числовым ключам metadata_info для диапазонных запросов,
+    # lower(col) COLLATE "C" для префиксных подсказок (LIKE 'abc%' + ORDER BY),
+    # составные индексы (col, id) для keyset-пагинации
     __table_args__ = (
         Index('ix_books_metadata_info_gin', metadata_info, postgresql_using='gin'),
+        Index('ix_books_search_vector', search_vector, postgresql_using='gin'),
+        Index('ix_books_title_lower_c', sa.func.lower(title).collate('C')),
+        Index('ix_books_author_lower_c', sa.func.lower(author).collate('C')),
+        Index('ix_books_metadata_pages', metadata_info['pages']),
+        Index('ix_books_metadata_rating', metadata_info['rating']),
+        Index('ix_books_title_id', title, id),
+        Index('ix_books_author_id', author, id),
+        Index('ix_books_price_id', price, id),
+        Index('ix_books_published_date_id', published_date, id),
+        # Пакетная переоценка обходит жанр по возрастанию id
+        Index('ix_books_genre_id', genre, id),
     )
 
+# Заказы секционированы по месяцам order_date (orders_YYYY_MM): запросы с
+# условием на order_date читают только свои партиции, а старые месяцы
+# отсоединяются целиком (scripts/orders_partitions.py). Ключ партиционирования
+# обязан входить в первичный ключ, поэтому он составной: (id, order_date).
 class Order(Base):
     __tablename__ = "orders"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False, index=True)
     customer_name = Column(String(100), nullable=False)
     customer_email = Column(String(100), nullable=False, index=True)
-    order_date = Column(Date, nullable=False, index=True)
+    order_date = Column(Date, primary_key=True, nullable=False, index=True)
     quantity = Column(Integer, default=1)
     total_price = Column(Numeric(10, 2))
     status = Column(String(20), default="pending", index=True)
@@ -43,6 +83,8 @@ class Order(Base):
     # Связи
     book = relationship("Book", back_populates="orders")
 
+    __table_args__ = {"postgresql_partition_by": "RANGE (order_date)"}
+
 # Модель для статистики
 class BookStat(Base):
     __tablename__ = "book_stats"
@@ -50,7 +92,173 @@ class BookStat(Base):
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), unique=True)
     total_orders = Column(Integer, default=0)
-    total_revenue = Column(Numeric(10, 2), default=0)
+    total_revenue = Column(Numeric(14, 2), default=0)
     average_rating = Column(Numeric(3, 2))
     
-    book = relationship("Book")
\ No newline at end of file
+    book = relationship("Book")
+
+# book_stats поддерживается триггером на orders: один пересчет на INSERT-запрос
+# (а не на строку), поэтому и одиночные заказы, и COPY обновляют статистику.
+# Тот же SQL применяется миграцией add_book_stats_trigger.
+BOOK_STATS_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION book_stats_on_orders_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO book_stats (book_id, total_orders, total_revenue)
+    SELECT book_id, count(*), coalesce(sum(total_price), 0)
+    FROM new_orders
+    GROUP BY book_id
+    ORDER BY book_id
+    ON CONFLICT (book_id) DO UPDATE
+    SET total_orders = book_stats.total_orders + EXCLUDED.total_orders,
+        total_revenue = book_stats.total_revenue + EXCLUDED.total_revenue;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_orders_book_stats
+AFTER INSERT ON orders
+REFERENCING NEW TABLE AS new_orders
+FOR EACH STATEMENT EXECUTE FUNCTION book_stats_on_orders_insert();
+"""
+
+event.listen(Order.__table__, "after_create", DDL(BOOK_STATS_TRIGGER_SQL))
+
+# Дневная сводка продаж. Строка на (день, статус, шард): шард = id заказа % 8,
+# чтобы параллельные заказы одного дня не выстраивались в очередь за одной строкой.
+# При чтении шарды суммируются.
+DAILY_SALES_SHARDS = 8
+
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+
+    sales_date = Column(Date, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    total_sales = Column(Numeric(14, 2), nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+# Сводка пополняется триггером на вставку заказов, так же как book_stats.
+# Тот же SQL применяется миграцией add_daily_sales_rollup
+# (%% — экранирование % для DDL).
+DAILY_SALES_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION daily_sales_on_orders_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO daily_sales (sales_date, status, shard, total_sales, order_count)
+    SELECT order_date, coalesce(status, 'pending'), id %% {DAILY_SALES_SHARDS},
+           coalesce(sum(total_price), 0), count(*)
+    FROM new_orders
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (sales_date, status, shard) DO UPDATE
+    SET total_sales = daily_sales.total_sales + EXCLUDED.total_sales,
+        order_count = daily_sales.order_count + EXCLUDED.order_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_orders_daily_sales
+AFTER INSERT ON orders
+REFERENCING NEW TABLE AS new_orders
+FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_on_orders_insert();
+"""
+
+event.listen(Order.__table__, "after_create", DDL(DAILY_SALES_TRIGGER_SQL))
+
+# Месячные партиции orders. Заказ с датой, для которой партиции нет, попадает
+# в orders_default; orders_create_partition переносит такие заказы в новую
+# партицию. Перенос идет мимо orders, поэтому триггеры сводок не срабатывают
+# повторно. Партиции на ORDERS_PARTITIONS_AHEAD месяцев вперед создает воркер
+# (app/startup.py). Тот же SQL применяется миграцией add_orders_partitioning
+# (%% — экранирование % для DDL).
+ORDERS_PARTITIONS_SQL = """
+CREATE OR REPLACE FUNCTION orders_create_partition(month date) RETURNS text AS $$
+DECLARE
+    lower_bound date := date_trunc('month', month)::date;
+    upper_bound date := (date_trunc('month', month) + interval '1 month')::date;
+    partition_name text := 'orders_' || to_char(month, 'YYYY_MM');
+BEGIN
+    -- Воркеры и скрипты создают партиции по очереди
+    PERFORM pg_advisory_xact_lock(hashtext('orders_create_partition'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('CREATE TABLE %%I (LIKE orders INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM orders_default WHERE order_date >= %%L AND order_date < %%L RETURNING *) '
+        'INSERT INTO %%I SELECT * FROM moved',
+        lower_bound, upper_bound, partition_name
+    );
+    EXECUTE format('ALTER TABLE orders ATTACH PARTITION %%I FOR VALUES FROM (%%L) TO (%%L)',
+                   partition_name, lower_bound, upper_bound);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION orders_create_partitions(date_from date, date_to date) RETURNS SETOF text AS $$
+    SELECT created
+    FROM generate_series(date_trunc('month', date_from), date_trunc('month', date_to), interval '1 month') AS month,
+         orders_create_partition(month::date) AS created
+    WHERE created IS NOT NULL;
+$$ LANGUAGE sql;
+
+CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+
+SELECT orders_create_partitions(current_date, (current_date + interval '3 months')::date);
+"""
+
+event.listen(Order.__table__, "after_create", DDL(ORDERS_PARTITIONS_SQL))
+
+# Задание пакетной переоценки. Каждая пачка книг коммитится вместе
+# с прогрессом задания, поэтому после сбоя задание продолжается с
+# last_book_id и ни одна книга не переоценивается дважды.
+class RepricingJob(Base):
+    __tablename__ = "repricing_jobs"
+
+    id = Column(Integer, primary_key=True)
+    genres = Column(JSONB, nullable=False)
+    change_type = Column(String(10), nullable=False)   # percent | absolute
+    amount = Column(Numeric(10, 2), nullable=False)
+    batch_size = Column(Integer, nullable=False)
+    status = Column(String(10), nullable=False, default="pending")   # pending | running | done | failed
+    # Проход по книгам в порядке id: последняя обработанная книга
+    last_book_id = Column(Integer, nullable=False, default=0)
+    scan_done = Column(Boolean, nullable=False, default=False)
+    # Книги, заблокированные заказами во время прохода (SKIP LOCKED); повторяются в конце
+    skipped_ids = Column(JSONB, nullable=False, default=list)
+    retries = Column(Integer, nullable=False, default=0)
+    updated_books = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=sa.func.now(), onupdate=sa.func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+# Агрегаты по жанрам хранятся в материализованном представлении и
+# обновляются REFRESH ... CONCURRENTLY (нужен уникальный индекс по genre),
+# так что чтение не блокируется на время пересчета. refreshed_at — время
+# последнего пересчета. Тот же SQL применяется миграцией add_genre_stats_mv.
+GENRE_STATS_MV_SQL = """
+CREATE MATERIALIZED VIEW genre_stats_mv AS
+SELECT genre,
+       count(id) AS book_count,
+       sum(quantity) AS total_quantity,
+       avg(price) AS avg_price,
+       now() AS refreshed_at
+FROM books
+WHERE genre IS NOT NULL
+GROUP BY genre;
+
+CREATE UNIQUE INDEX ux_genre_stats_mv_genre ON genre_stats_mv (genre);
+"""
+
+event.listen(Book.__table__, "after_create", DDL(GENRE_STATS_MV_SQL))
+event.listen(Book.__table__, "before_drop", DDL("DROP MATERIALIZED VIEW IF EXISTS genre_stats_mv"))
+
+# Представление не входит в Base.metadata (create_all создал бы его как таблицу)
+genre_stats_mv = table(
+    "genre_stats_mv",
+    column("genre"),
+    column("book_count"),
+    column("total_quantity"),
+    column("avg_price"),
+    column("refreshed_at"),
+)
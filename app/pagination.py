@@ -0,0 +1,61 @@
+"""
+Keyset (cursor) пагинация.
+
+Курсор — непрозрачная для клиента строка (base64url от JSON), в которой
+хранится поле сортировки, направление и последняя пара (sort_key, id)
+предыдущей страницы.
+"""
+import base64
+import binascii
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Optional
+
+# Колонки, по которым разрешена keyset-сортировка.
+# Для каждой из них есть составной индекс (col, id).
+SORTABLE_COLUMNS = ("title", "author", "price", "published_date")
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не соответствует параметрам запроса"""
+
+
+def _dump_value(value: Any):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _load_value(sort_by: Optional[str], value: Any):
+    if value is None:
+        return None
+    if sort_by == "price":
+        return Decimal(value)
+    if sort_by == "published_date":
+        return date.fromisoformat(value)
+    return str(value)
+
+
+def encode_cursor(sort_by: Optional[str], sort_desc: bool, last_value: Any, last_id: int) -> str:
+    payload = {"s": sort_by, "d": sort_desc, "v": _dump_value(last_value), "i": last_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: Optional[str], sort_desc: bool):
+    """Возвращает пару (last_value, last_id) из курсора"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_sort, cursor_desc = payload["s"], bool(payload["d"])
+        last_value = _load_value(cursor_sort, payload["v"])
+        last_id = int(payload["i"])
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidOperation) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+
+    if cursor_sort != sort_by or cursor_desc != sort_desc:
+        raise InvalidCursor("Курсор получен для другой сортировки")
+    return last_value, last_id
@@ -0,0 +1,35 @@
+"""
+Частичная выборка полей книги: ?fields=title,author,price.
+
+Список проверяется по колонкам таблицы books и попадает в сам SELECT,
+поэтому ненужные description и metadata_info не читаются из базы,
+не передаются по сети и не сериализуются. id и version выбираются
+всегда: по ним строятся ссылки на книгу и ETag.
+"""
+from typing import Optional, Tuple
+
+from app.models.book import Book
+
+# Поля в порядке колонок таблицы; поисковый вектор наружу не отдается
+BOOK_FIELDS = tuple(column.key for column in Book.__table__.c if column.key != "search_vector")
+REQUIRED_FIELDS = ("id", "version")
+
+
+class InvalidFields(ValueError):
+    """В fields есть имена, которых нет среди колонок книги"""
+
+
+def parse_fields(raw: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    'price,title' -> ('id', 'title', 'price', 'version'); None — все поля.
+    Порядок всегда как в BOOK_FIELDS: одинаковые наборы дают одинаковый
+    ключ кеша.
+    """
+    if raw is None or not raw.strip():
+        return None
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = sorted(requested.difference(BOOK_FIELDS))
+    if unknown:
+        raise InvalidFields(f"Неизвестные поля: {', '.join(unknown)}; доступны: {', '.join(BOOK_FIELDS)}")
+    selected = requested.union(REQUIRED_FIELDS)
+    return tuple(name for name in BOOK_FIELDS if name in selected)
@@ -0,0 +1,150 @@
+"""
+Чтение с реплик (DATABASE_REPLICA_URLS).
+
+RoutingSession выбирает движок для каждого запроса в get_bind:
+
+* SELECT без FOR UPDATE/SHARE идет на реплику; text() — только если он
+  помечен execution_options(replica_safe=True);
+* запись, flush, блокирующее чтение и любой непомеченный text() идут
+  на primary, и после этого сессия остается на primary до конца
+  (read-your-writes: refresh после create_book, чтение после
+  create_order видят свою же запись);
+* сессия, помеченная use_primary(), с самого начала работает с primary:
+  так get_async_db поступает для всех не-GET запросов, чтобы чтение
+  перед записью не видело отставшую реплику.
+
+Одна сессия держится одной реплики: SET LOCAL и следующий за ним SELECT
+выполняются на одном соединении. Отставание реплики проверяется не
+чаще раза в DB_REPLICA_CHECK_INTERVAL секунд: реплика, отставшая больше
+DB_REPLICA_MAX_LAG секунд или недоступная, не используется, и чтение
+уходит на primary.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "2"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "1"))
+
+_USE_PRIMARY = "use_primary"
+_REPLICA = "replica_engine"
+
+_PRIMARY_LSN = text("SELECT pg_current_wal_lsn()::text")
+# Реплика догнала primary, если воспроизвела его текущий LSN; иначе отставание —
+# возраст последней воспроизведенной транзакции. Не standby (например, копия для
+# тестов или цель логической репликации) считается не отстающей.
+_REPLICA_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= CAST(CAST(:primary_lsn AS text) AS pg_lsn) THEN 0
+        ELSE EXTRACT(EPOCH FROM clock_timestamp() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaSet:
+    """Реплики одного primary с периодической проверкой отставания"""
+
+    def __init__(self, primary, replicas: List, max_lag: float = DB_REPLICA_MAX_LAG,
+                 check_interval: float = DB_REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status = [{"available": False, "lag": None, "error": None} for _ in replicas]
+        self._checked_at = float("-inf")
+        self._check_lock = threading.Lock()
+        self._next = itertools.count()
+        self.fallbacks = 0
+
+    def choose(self):
+        """Реплика по кругу среди доступных или None (читать с primary)"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.check()
+        available = [replica for replica, status in zip(self.replicas, self._status) if status["available"]]
+        if not available:
+            self.fallbacks += 1
+            return None
+        return available[next(self._next) % len(available)]
+
+    def check(self):
+        # Проверяет один вызывающий; остальные пока используют прежний статус
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                with self.primary.connect() as connection:
+                    primary_lsn = connection.execute(_PRIMARY_LSN).scalar()
+            except Exception:
+                # Без primary отставание не измерить: оставляем прежний статус
+                self._checked_at = time.monotonic()
+                return
+            for replica, status in zip(self.replicas, self._status):
+                try:
+                    with replica.connect() as connection:
+                        lag = connection.execute(_REPLICA_LAG, {"primary_lsn": primary_lsn}).scalar()
+                    lag = float(lag) if lag is not None else None
+                    status.update(lag=lag, error=None, available=lag is not None and lag <= self.max_lag)
+                except Exception as e:
+                    status.update(lag=None, error=f"{e.__class__.__name__}: {str(e).splitlines()[0]}",
+                                  available=False)
+            self._checked_at = time.monotonic()
+        finally:
+            self._check_lock.release()
+
+    def status(self) -> List[dict]:
+        return [
+            {"url": replica.url.render_as_string(hide_password=True), **status}
+            for replica, status in zip(self.replicas, self._status)
+        ]
+
+
+def _is_replica_safe(clause) -> bool:
+    if clause is None:
+        return False
+    if getattr(clause, "is_select", False):
+        return getattr(clause, "_for_update_arg", None) is None
+    if isinstance(clause, TextClause):
+        return clause.get_execution_options().get("replica_safe", False)
+    return False
+
+
+class RoutingSession(Session):
+    """Session, который читает с реплики, а пишет и читает после записи с primary"""
+
+    replica_set: Optional[ReplicaSet] = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = super().get_bind(mapper, clause=clause, **kw)
+        if self.replica_set is None or self.info.get(_USE_PRIMARY):
+            return primary
+        if self._flushing or not _is_replica_safe(clause):
+            self.info[_USE_PRIMARY] = True
+            return primary
+        if _REPLICA not in self.info:
+            self.info[_REPLICA] = self.replica_set.choose()
+        return self.info[_REPLICA] or primary
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _pass_clause_to_get_bind(orm_execute_state):
+    # Для ORM-выражений без сущности (UNION колонок модели) SQLAlchemy вызывает
+    # get_bind без clause; без него такой SELECT считался бы записью
+    orm_execute_state.bind_arguments.setdefault("clause", orm_execute_state.statement)
+
+
+def use_primary(db):
+    """Все запросы сессии — на primary (запись, чтение перед записью, фоновые задания)"""
+    db.info[_USE_PRIMARY] = True
+    return db
+
+
+def read_from_replica(db) -> bool:
+    """Сессия читала с реплики: прочитанное может отставать на DB_REPLICA_MAX_LAG"""
+    return db.info.get(_REPLICA) is not None
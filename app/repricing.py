@@ -0,0 +1,107 @@
+"""
+Исполнение заданий пакетной переоценки (repricing_jobs).
+
+Задание обрабатывается шагами. Каждый шаг — одна транзакция: строка
+задания блокируется, переоценивается следующая пачка книг, и прогресс
+(last_book_id, skipped_ids, updated_books) коммитится вместе с ценами.
+Поэтому после падения процесса задание продолжается с того же места
+(POST /books/repricing/{id}/resume), и ни одна книга не переоценивается
+дважды.
+
+Сначала книги обходятся по возрастанию id. Книги, которые в этот момент
+держат заказы (SKIP LOCKED), откладываются в skipped_ids и повторяются
+после прохода. Если строки так и не освобождаются, ожидание растет,
+а через REPRICE_MAX_RETRIES повторов без прогресса задание завершается
+с оставшимися skipped_ids. Между пачками делается пауза REPRICE_PAUSE:
+переоценка в рабочее время не должна создавать всплеск WAL.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.exc import DBAPIError
+
+from app.crud.book import (
+    REPRICE_MAX_RETRIES, REPRICE_RETRY_DELAY, AsyncBookCRUD, AsyncRepricingJobCRUD
+)
+from app.database import AsyncSessionLocal
+from app.replicas import use_primary
+
+REPRICE_PAUSE = float(os.getenv("REPRICE_PAUSE", "0.05"))
+
+
+async def _run_step(db, job_id: int) -> Optional[float]:
+    """Одна пачка задания. Возвращает паузу перед следующим шагом или None, если задание закончено"""
+    job = await AsyncRepricingJobCRUD.lock_job(db, job_id)
+    if job is None or job.status == "done":
+        await db.rollback()
+        return None
+
+    job.status = "running"
+    pause = REPRICE_PAUSE
+    if not job.scan_done:
+        book_ids = await AsyncBookCRUD.reprice_candidates(db, job.genres, job.last_book_id, job.batch_size)
+        if book_ids:
+            updated, skipped = await AsyncBookCRUD.reprice_batch(
+                db, book_ids, job.genres, job.change_type, job.amount
+            )
+            job.last_book_id = book_ids[-1]
+            job.skipped_ids = job.skipped_ids + skipped
+            job.updated_books += len(updated)
+        else:
+            job.scan_done = True
+    elif job.skipped_ids and job.retries < REPRICE_MAX_RETRIES:
+        book_ids = job.skipped_ids[:job.batch_size]
+        updated, skipped = await AsyncBookCRUD.reprice_batch(db, book_ids, job.genres, job.change_type, job.amount)
+        job.skipped_ids = job.skipped_ids[job.batch_size:] + skipped
+        job.updated_books += len(updated)
+        if not updated:
+            # Строки все еще заняты: ждем дольше перед следующей попыткой
+            job.retries += 1
+            pause = REPRICE_RETRY_DELAY * job.retries
+    else:
+        job.status = "done"
+        job.finished_at = datetime.now(timezone.utc)
+        pause = None
+
+    await db.commit()
+    return pause
+
+
+async def _mark_failed(job_id: int, error: Exception) -> None:
+    async with use_primary(AsyncSessionLocal()) as db:
+        job = await AsyncRepricingJobCRUD.lock_job(db, job_id)
+        if job is not None:
+            job.status = "failed"
+            job.error = f"{error.__class__.__name__}: {error}"
+            await db.commit()
+
+
+async def run_repricing_job(job_id: int) -> None:
+    """
+    Выполняет задание до конца. Ошибки базы (deadlock, обрыв соединения)
+    повторяются с растущей паузой; после REPRICE_MAX_RETRIES подряд задание
+    помечается failed и может быть продолжено через resume.
+    """
+    failures = 0
+    async with use_primary(AsyncSessionLocal()) as db:
+        while True:
+            try:
+                pause = await _run_step(db, job_id)
+                failures = 0
+            except DBAPIError as e:
+                await db.rollback()
+                failures += 1
+                if failures > REPRICE_MAX_RETRIES:
+                    await _mark_failed(job_id, e)
+                    return
+                await asyncio.sleep(REPRICE_RETRY_DELAY * failures)
+                continue
+            except Exception as e:
+                await db.rollback()
+                await _mark_failed(job_id, e)
+                return
+            if pause is None:
+                return
+            await asyncio.sleep(pause)
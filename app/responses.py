@@ -0,0 +1,28 @@
+"""
+Быстрая сериализация ответов со списками.
+
+Списки книг читаются строками Core (словари) и отдаются через orjson без
+повторной валидации pydantic: строки приходят из колонок books и уже
+совпадают со схемой BookInDB. Decimal кодируется строкой, как в pydantic,
+поэтому JSON такой же, как у обычного пути через response_model.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
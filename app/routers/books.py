@@ -1,134 +1,403 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple, Union
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
 
-from app.database import get_db
-from app.schemas.book import BookCreate, BookUpdate, BookInDB, OrderCreate, OrderInDB
-from app.crud.book import BookCRUD, OrderCRUD
+from app.database import get_async_db
+from app.cache import suggest_cache
+from app.responses import ORJSONResponse
+from app.etag import book_etag, book_list_etag, genre_stats_etag, is_not_modified, not_modified, stats_etag
+from app.schemas.book import (
+    BookCreate, BookUpdate, BookInDB, BookPage, BookPartial, BookSearchPage, BookStatInDB, BookWithOrders,
+    BookSuggestions, BulkBatchResult, BulkIngestResult, BulkRowError, GenreStatistics, OrderCreate, OrderInDB,
+    RepricingCreate, RepricingJobInDB
+)
+from app.ingest import MAX_ERRORS_PER_BATCH, iter_book_batches
+from app.streaming import ndjson_response, wants_stream
+from app.crud.book import AsyncBookCRUD, AsyncBookStatCRUD, AsyncOrderCRUD, AsyncRepricingJobCRUD
+from app.metadata_query import InvalidMetadataQuery, parse_contains, parse_keys, parse_range
+from app.projection import InvalidFields, parse_fields
+from app.pagination import SORTABLE_COLUMNS, InvalidCursor, decode_cursor, encode_cursor
+from app.repricing import run_repricing_job
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+# Списки книг отдаются ORJSONResponse без повторной валидации (см. app/responses.py);
+# response_model у этих маршрутов остается для документации
+_BOOKS_WITH_ORDERS = TypeAdapter(List[BookWithOrders])
+
+def book_fields(
+    fields: Optional[str] = Query(None, description="Поля книги через запятую, например title,author,price")
+) -> Optional[Tuple[str, ...]]:
+    """Зависимость для ?fields=: проверенный список колонок для SELECT или None"""
+    try:
+        return parse_fields(fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/", response_model=BookInDB)
-def create_book(book: BookCreate, db: Session = Depends(get_db)):
-    return BookCRUD.create_book(db, book)
+async def create_book(book: BookCreate, db: AsyncSession = Depends(get_async_db)):
+    return await AsyncBookCRUD.create_book(db, book)
+
+@router.post("/bulk", response_model=BulkIngestResult)
+async def bulk_create_books(
+    request: Request,
+    batch_size: int = Query(1000, ge=1, le=3000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Массовая загрузка книг из потока NDJSON или CSV (Content-Type: text/csv), upsert по isbn"""
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    result = BulkIngestResult()
+
+    async for rows, errors in iter_book_batches(request.stream(), fmt, batch_size):
+        batch = BulkBatchResult(batch=len(result.batches) + 1, rejected=len(errors))
 
-@router.get("/", response_model=List[BookInDB])
-def read_books(
+        # Повтор isbn внутри одной пачки ON CONFLICT обработать не может: оставляем последнюю запись
+        unique_rows = {}
+        for row in rows:
+            if row["isbn"] in unique_rows:
+                batch.rejected += 1
+            unique_rows[row["isbn"]] = row
+        if len(unique_rows) < len(rows):
+            errors.append((0, f"повторяющиеся isbn в пачке: {len(rows) - len(unique_rows)}, сохранены последние"))
+
+        try:
+            batch.inserted, batch.updated = await AsyncBookCRUD.upsert_books(db, list(unique_rows.values()))
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            batch.rejected += len(unique_rows)
+            errors.append((0, f"ошибка загрузки пачки: {e.__class__.__name__}: {getattr(e, 'orig', e)}"))
+
+        batch.errors = [BulkRowError(line=line, error=error) for line, error in errors[:MAX_ERRORS_PER_BATCH]]
+        result.batches.append(batch)
+        result.inserted += batch.inserted
+        result.updated += batch.updated
+        result.rejected += batch.rejected
+
+    return result
+
+@router.get("/", response_model=List[Union[BookInDB, BookPartial]])
+async def read_books(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     sort_by: Optional[str] = Query(None, description="Поле для сортировки (title, author, price, published_date)"),
     sort_desc: bool = False,
-    db: Session = Depends(get_db)
+    fields: Optional[Tuple[str, ...]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список книг с пагинацией и сортировкой"""
-    from sqlalchemy import asc, desc
-    from app.models.book import Book
-    
-    query = db.query(Book)
-    
-    # Применяем сортировку
-    if sort_by:
-        sort_column = getattr(Book, sort_by, None)
-        if sort_column:
-            query = query.order_by(desc(sort_column) if sort_desc else asc(sort_column))
-    
-    return query.offset(skip).limit(limit).all()
+    if request.headers.get("if-none-match"):
+        # Проверка по (id, version) страницы, без чтения самих книг
+        versions = await AsyncBookCRUD.get_book_versions(db, skip, limit, sort_by, sort_desc)
+        etag = book_list_etag(versions, fields)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+    books = await AsyncBookCRUD.get_books(db, skip, limit, sort_by, sort_desc, fields)
+    etag = book_list_etag(((book["id"], book["version"]) for book in books), fields)
+    return ORJSONResponse(books, headers={"ETag": etag})
+
+@router.get("/cursor/", response_model=BookPage)
+async def read_books_cursor(
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    limit: int = Query(100, ge=1, le=1000),
+    sort_by: Optional[str] = Query(None, description="Поле для сортировки (title, author, price, published_date)"),
+    sort_desc: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Keyset-пагинация: каждая страница стоит одинаково независимо от глубины"""
+    if sort_by is not None and sort_by not in SORTABLE_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Сортировка возможна только по: {', '.join(SORTABLE_COLUMNS)}")
+
+    try:
+        after = decode_cursor(cursor, sort_by, sort_desc) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Запрашиваем на одну строку больше, чтобы понять, есть ли следующая страница
+    books = await AsyncBookCRUD.get_books_keyset(db, sort_by, sort_desc, after, limit + 1)
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        last = books[-1]
+        last_value = last[sort_by] if sort_by else None
+        next_cursor = encode_cursor(sort_by, sort_desc, last_value, last["id"])
+    return ORJSONResponse({"items": books, "next_cursor": next_cursor})
+
+@router.get("/stats/", response_model=List[BookStatInDB])
+async def read_books_stats(
+    request: Request,
+    response: Response,
+    ids: List[int] = Query(..., description="id книг (до 1000)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Статистика продаж сразу по нескольким книгам из book_stats"""
+    if len(ids) > 1000:
+        raise HTTPException(status_code=400, detail="Не более 1000 id за запрос")
+    stats = {stat.book_id: stat for stat in await AsyncBookStatCRUD.get_stats_bulk(db, ids)}
+    # У книг без заказов строки в book_stats нет: отдаем нули
+    result = [stats.get(book_id) or BookStatInDB(book_id=book_id) for book_id in dict.fromkeys(ids)]
+    etag = stats_etag(result)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return result
+
+@router.get("/suggest", response_model=BookSuggestions)
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=100, description="Начало названия или имени автора"),
+    limit: int = Query(8, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Подсказки для строки поиска: названия и авторы по префиксу, с запасным поиском по опечаткам"""
+    term = " ".join(q.lower().split())
+    if not term:
+        return {"titles": [], "authors": []}
+    suggestions = suggest_cache.get((term, limit))
+    if suggestions is None:
+        suggestions, timed_out = await AsyncBookCRUD.suggest(db, term, limit)
+        # Неполный ответ после таймаута не кешируется: следующий запрос повторит поиск
+        if not timed_out:
+            suggest_cache.set((term, limit), suggestions)
+    return suggestions
 
 @router.get("/{book_id}", response_model=BookInDB)
-def read_book(book_id: int, db: Session = Depends(get_db)):
-    db_book = BookCRUD.get_book(db, book_id)
+async def read_book(book_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    db_book = await AsyncBookCRUD.get_book(db, book_id)
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
+    etag = book_etag(db_book)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return db_book
 
+@router.get("/{book_id}/stats", response_model=BookStatInDB)
+async def read_book_stats(
+    book_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    """Статистика продаж книги: готовая строка book_stats вместо агрегации заказов"""
+    stat = await AsyncBookStatCRUD.get_stats(db, book_id)
+    if stat is None:
+        if await AsyncBookCRUD.get_book(db, book_id) is None:
+            raise HTTPException(status_code=404, detail="Book not found")
+        stat = BookStatInDB(book_id=book_id)
+    etag = stats_etag([stat])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return stat
+
 @router.put("/{book_id}", response_model=BookInDB)
-def update_book(book_id: int, book: BookUpdate, db: Session = Depends(get_db)):
-    db_book = BookCRUD.update_book(db, book_id, book)
+async def update_book(book_id: int, book: BookUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_book = await AsyncBookCRUD.update_book(db, book_id, book)
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
     return db_book
 
 @router.delete("/{book_id}")
-def delete_book(book_id: int, db: Session = Depends(get_db)):
-    success = BookCRUD.delete_book(db, book_id)
+async def delete_book(book_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await AsyncBookCRUD.delete_book(db, book_id)
     if not success:
         raise HTTPException(status_code=404, detail="Book not found")
     return {"message": "Book deleted successfully"}
 
 # Сложные запросы
 
-@router.get("/filter/advanced/")
-def get_books_advanced(
+@router.get("/filter/advanced/", response_model=List[Union[BookInDB, BookPartial]])
+async def get_books_advanced(
+    request: Request,
     genre: Optional[str] = None,
     min_price: Optional[Decimal] = None,
     max_price: Optional[Decimal] = None,
     min_date: Optional[date] = None,
     in_stock: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    stream: bool = Query(False, description="Отдать результат потоком NDJSON"),
+    fields: Optional[Tuple[str, ...]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """SELECT ... WHERE с несколькими условиями"""
-    return BookCRUD.get_books_by_filters(
-        db, genre, min_price, max_price, min_date, in_stock
-    )
+    if wants_stream(request, stream):
+        return await ndjson_response(lambda stream_db: AsyncBookCRUD.stream_books_by_filters(
+            stream_db, genre, min_price, max_price, min_date, in_stock, fields
+        ))
+    return ORJSONResponse(await AsyncBookCRUD.get_books_by_filters(
+        db, genre, min_price, max_price, min_date, in_stock, fields
+    ))
 
-@router.get("/with-orders/")
-def get_books_with_orders(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+@router.get("/with-orders/", response_model=List[BookWithOrders])
+async def get_books_with_orders(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """JOIN запрос: книги с их заказами"""
-    return BookCRUD.get_books_with_orders(db, skip, limit)
+    """Книги, у которых есть заказы, вместе со списком заказов; пагинация по книгам"""
+    # Вся страница проверяется и сериализуется одним вызовом pydantic-core
+    books = _BOOKS_WITH_ORDERS.validate_python(
+        await AsyncBookCRUD.get_books_with_orders(db, skip, limit), from_attributes=True
+    )
+    return Response(_BOOKS_WITH_ORDERS.dump_json(books), media_type="application/json")
 
-@router.get("/statistics/genre/")
-def get_genre_statistics(db: Session = Depends(get_db)):
-    """GROUP BY: статистика по жанрам"""
-    return BookCRUD.get_genre_statistics(db)
+@router.get("/statistics/genre/", response_model=GenreStatistics)
+async def get_genre_statistics(
+    request: Request,
+    response: Response,
+    refresh: bool = Query(False, description="Пересчитать статистику перед ответом"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """GROUP BY: статистика по жанрам из материализованного представления"""
+    refreshed_at, rows = await AsyncBookCRUD.get_genre_statistics(db, refresh=refresh)
+    etag = genre_stats_etag(refreshed_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return {"refreshed_at": refreshed_at, "genres": rows}
 
 @router.put("/discount/{genre}/")
-def apply_genre_discount(
+async def apply_genre_discount(
     genre: str,
     discount_percent: Decimal = Query(..., ge=0, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """UPDATE с нетривиальным условием: скидка на жанр"""
-    updated_count = BookCRUD.apply_discount_to_genre(db, genre, discount_percent)
-    db.commit()
-    return {"updated_books": updated_count}
+    """
+    UPDATE с нетривиальным условием: скидка на жанр. Выполняется пачками
+    с SKIP LOCKED; skipped_books — книги, которые так и остались заняты
+    заказами. Для больших жанров используйте POST /books/repricing.
+    """
+    updated_count, skipped = await AsyncBookCRUD.apply_discount_to_genre(db, genre, discount_percent)
+    return {"updated_books": updated_count, "skipped_books": len(skipped)}
+
+@router.post("/repricing", response_model=RepricingJobInDB, status_code=202)
+async def create_repricing_job(
+    job: RepricingCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Фоновая переоценка нескольких жанров; прогресс — GET /books/repricing/{job_id}"""
+    db_job = await AsyncRepricingJobCRUD.create_job(db, job)
+    background_tasks.add_task(run_repricing_job, db_job.id)
+    return db_job
+
+@router.get("/repricing/{job_id}", response_model=RepricingJobInDB)
+async def read_repricing_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_job = await AsyncRepricingJobCRUD.get_job(db, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Repricing job not found")
+    return db_job
+
+@router.post("/repricing/{job_id}/resume", response_model=RepricingJobInDB, status_code=202)
+async def resume_repricing_job(job_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    """Продолжает задание после падения процесса или ошибки с сохраненного места"""
+    db_job = await AsyncRepricingJobCRUD.get_job(db, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Repricing job not found")
+    if db_job.status == "done":
+        raise HTTPException(status_code=409, detail="Repricing job is already done")
+    background_tasks.add_task(run_repricing_job, db_job.id)
+    return db_job
 
 @router.get("/search/metadata/")
-def search_in_metadata(
+async def search_in_metadata(
+    request: Request,
     q: str = Query(..., description="Поисковый запрос для JSON поля"),
-    db: Session = Depends(get_db)
+    stream: bool = Query(False, description="Отдать результат потоком NDJSON"),
+    fields: Optional[Tuple[str, ...]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Полнотекстовый поиск по JSON полю"""
-    results = BookCRUD.search_in_metadata(db, q)
-    return [dict(row) for row in results]
+    if wants_stream(request, stream):
+        return await ndjson_response(lambda stream_db: AsyncBookCRUD.stream_search_in_metadata(stream_db, q, fields))
+    return ORJSONResponse(await AsyncBookCRUD.search_in_metadata(db, q, fields))
+
+@router.get("/search/metadata/query", response_model=List[Union[BookInDB, BookPartial]])
+async def query_metadata(
+    contains: Optional[str] = Query(None, description='JSON-объект для @>, например {"language": "English"}'),
+    has_key: Optional[List[str]] = Query(None, description="Ключи, которые должны присутствовать"),
+    tag: Optional[List[str]] = Query(None, description="Метки из metadata_info.tags (все сразу)"),
+    range_specs: Optional[List[str]] = Query(
+        None, alias="range", description="Числовой диапазон 'ключ:от:до', например pages:100:300"
+    ),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[Tuple[str, ...]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Структурированный поиск по metadata_info, обслуживаемый GIN-индексом"""
+    try:
+        document = parse_contains(contains)
+        keys = parse_keys(has_key)
+        ranges = [parse_range(spec) for spec in range_specs or []]
+    except InvalidMetadataQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not (document or keys or tag or ranges):
+        raise HTTPException(status_code=400, detail="Нужно хотя бы одно условие: contains, has_key, tag или range")
+    return ORJSONResponse(await AsyncBookCRUD.query_metadata(db, document, keys, tag, ranges, skip, limit, fields))
 
 # Orders endpoints
 @router.post("/orders/", response_model=OrderInDB)
-def create_order(order: OrderCreate, db: Session = Depends(get_db)):
-    db_order = OrderCRUD.create_order(db, order)
+async def create_order(order: OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    db_order = await AsyncOrderCRUD.create_order(db, order)
     if db_order is None:
         raise HTTPException(status_code=400, detail="Недостаточно книг на складе или книга не найдена")
     return db_order
 
+@router.get("/orders/daily")
+async def get_daily_sales_range(
+    date_from: date = Query(..., alias="from", description="Первый день диапазона"),
+    date_to: date = Query(..., alias="to", description="Последний день диапазона (включительно)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Продажи по дням за диапазон из сводки daily_sales, с разбивкой по статусам"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' не может быть раньше 'from'")
+    if (date_to - date_from).days >= 366:
+        raise HTTPException(status_code=400, detail="Диапазон не может превышать 366 дней")
+
+    days = {}
+    for row in await AsyncOrderCRUD.get_daily_sales_range(db, date_from, date_to):
+        day = days.setdefault(row.sales_date, {"total_sales": Decimal(0), "order_count": 0, "by_status": {}})
+        day["total_sales"] += row.total_sales
+        day["order_count"] += row.order_count
+        day["by_status"][row.status] = {"total_sales": row.total_sales, "order_count": row.order_count}
+
+    # Дни без продаж тоже попадают в ответ, с нулями
+    empty = {"total_sales": 0, "order_count": 0, "by_status": {}}
+    return {
+        "from": date_from,
+        "to": date_to,
+        "days": [
+            {"date": day, **days.get(day, empty)}
+            for day in (date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1))
+        ]
+    }
+
 @router.get("/orders/daily/{target_date}/")
-def get_daily_sales(target_date: date, db: Session = Depends(get_db)):
-    sales = OrderCRUD.get_daily_sales(db, target_date)
+async def get_daily_sales(target_date: date, db: AsyncSession = Depends(get_async_db)):
+    sales = await AsyncOrderCRUD.get_daily_sales(db, target_date)
     return {
         "date": target_date,
         "total_sales": sales.total_sales if sales else 0,
         "order_count": sales.order_count if sales else 0
     }
 
-@router.get("/search/fulltext/")
-def search_books_fulltext(
-    q: str = Query(..., description="Поисковый запрос для полнотекстового поиска"),
-    db: Session = Depends(get_db)
+@router.get("/search/fulltext/", response_model=BookSearchPage)
+async def search_books_fulltext(
+    request: Request,
+    q: str = Query(..., description="Запрос в синтаксисе веб-поиска: слова, \"фраза\", -исключение, OR"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    stream: bool = Query(False, description="Отдать все совпадения потоком NDJSON"),
+    fields: Optional[Tuple[str, ...]] = Depends(book_fields),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Полнотекстовый поиск по книгам с использованием pg_trgm"""
-    results = BookCRUD.search_books_fulltext(db, q)
-    return results
\ No newline at end of file
+    """Полнотекстовый поиск по tsvector: ранжирование ts_rank и подсветка совпадений"""
+    if wants_stream(request, stream):
+        return await ndjson_response(
+            lambda stream_db: AsyncBookCRUD.stream_search_books_fulltext(stream_db, q, fields)
+        )
+    results = await AsyncBookCRUD.search_books_fulltext(db, q, skip, limit, fields)
+    return ORJSONResponse({"items": results, "skip": skip, "limit": limit})
\ No newline at end of file
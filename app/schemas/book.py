@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
-from datetime import date
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, model_validator
+from datetime import date, datetime
+from typing import Optional, Dict, Any, List, Literal, Union
 from decimal import Decimal
 
 class BookBase(BaseModel):
@@ -27,10 +27,84 @@ class BookUpdate(BaseModel):
 
 class BookInDB(BookBase):
     id: int
+    version: int
     
     class Config:
         from_attributes = True
 
+class BookPage(BaseModel):
+    items: List[BookInDB]
+    next_cursor: Optional[str] = None
+
+class BookPartial(BaseModel):
+    """Книга при ?fields=...: в ответе только запрошенные поля, id и version"""
+    id: int
+    version: int
+    title: Optional[str] = None
+    author: Optional[str] = None
+    isbn: Optional[str] = None
+    published_date: Optional[date] = None
+    genre: Optional[str] = None
+    price: Optional[Decimal] = None
+    quantity: Optional[int] = None
+    description: Optional[str] = None
+    metadata_info: Optional[Dict[str, Any]] = None
+
+class BookSearchHit(BookInDB):
+    rank: float
+    title_highlight: str
+    snippet: str
+
+class BookSearchHitPartial(BookPartial):
+    rank: float
+    title_highlight: str
+    snippet: str
+
+class BookSearchPage(BaseModel):
+    items: List[Union[BookSearchHit, BookSearchHitPartial]]
+    skip: int
+    limit: int
+
+class BookSuggestions(BaseModel):
+    titles: List[str]
+    authors: List[str]
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkBatchResult(BaseModel):
+    batch: int
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: List[BulkRowError] = []
+
+class BulkIngestResult(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    batches: List[BulkBatchResult] = []
+
+class BookStatInDB(BaseModel):
+    book_id: int
+    total_orders: int = 0
+    total_revenue: Decimal = Decimal(0)
+    average_rating: Optional[Decimal] = None
+
+    class Config:
+        from_attributes = True
+
+class GenreStat(BaseModel):
+    genre: str
+    book_count: int
+    total_quantity: Optional[int] = None
+    avg_price: Optional[float] = None
+
+class GenreStatistics(BaseModel):
+    refreshed_at: Optional[datetime] = None
+    genres: List[GenreStat]
+
 class OrderBase(BaseModel):
     book_id: int
     customer_name: str
@@ -50,4 +124,40 @@ class OrderInDB(OrderBase):
     total_price: Decimal
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BookWithOrders(BookInDB):
+    orders: List[OrderInDB]
+
+class RepricingCreate(BaseModel):
+    genres: List[str] = Field(..., min_length=1, max_length=50)
+    # percent: +10 — наценка 10%, -10 — скидка 10%; absolute: сдвиг цены на amount
+    change_type: Literal["percent", "absolute"]
+    amount: Decimal = Field(..., max_digits=10, decimal_places=2)
+    batch_size: Optional[int] = Field(None, ge=1, le=10000)
+
+    @model_validator(mode="after")
+    def check_percent(self):
+        if self.change_type == "percent" and self.amount < -100:
+            raise ValueError("Скидка не может превышать 100%")
+        return self
+
+class RepricingJobInDB(BaseModel):
+    id: int
+    genres: List[str]
+    change_type: str
+    amount: Decimal
+    batch_size: int
+    status: str
+    last_book_id: int
+    scan_done: bool
+    skipped_ids: List[int]
+    retries: int
+    updated_books: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
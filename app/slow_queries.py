@@ -0,0 +1,223 @@
+"""
+Журнал медленных запросов с EXPLAIN (GET /debug/slow-queries).
+
+Включается SLOW_QUERY_LOG=true. Запросы дольше SLOW_QUERY_MS попадают
+в кольцевой буфер на SLOW_QUERY_BUFFER записей вместе с параметрами,
+шаблоном маршрута и методом CRUD, из которого выполнен запрос.
+
+Доля SLOW_QUERY_EXPLAIN_RATE медленных SELECT повторяется как
+EXPLAIN (ANALYZE, BUFFERS) на отдельном соединении в фоновом потоке:
+обработчик запроса не ждет плана, а пул приложения не расходует
+соединения. ANALYZE выполняет запрос, поэтому повторяются только чистые
+SELECT (без FOR UPDATE/SHARE, advisory-блокировок и nextval), в
+транзакции с откатом и с ограничением SLOW_QUERY_EXPLAIN_TIMEOUT_MS.
+Пока предыдущий EXPLAIN не закончен, новые не запускаются.
+
+Запросы asyncpg приходят с параметрами $1, $2; на psycopg2 они
+выполняются через PREPARE/EXECUTE, чтобы типы выводились так же.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import count
+from typing import List, Optional
+
+import greenlet
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool
+
+from app.metrics import current_request
+
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "100"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "5000"))
+
+# Параметры в журнале обрезаются: bulk-вставки несут тысячи значений
+_MAX_PARAMETERS_LENGTH = 2000
+
+_CRUD_PATH = os.path.join("app", "crud", "")
+_NUMBERED_PARAMETER = re.compile(r"\$(\d+)")
+_UNSAFE_TO_REPEAT = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE|"
+    r"PG_ADVISORY\w*|PG_TRY_ADVISORY\w*|NEXTVAL|SETVAL|PG_SLEEP)\b",
+    re.IGNORECASE
+)
+
+
+def is_explainable(statement: str) -> bool:
+    """Только SELECT, повтор которого ничего не меняет и не ждет блокировок"""
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head in ("SELECT", "WITH") and not _UNSAFE_TO_REPEAT.search(statement)
+
+
+def _crud_method() -> Optional[str]:
+    """
+    Ближайший метод из app/crud в стеке. Для асинхронного движка SQL
+    выполняется в greenlet; корутина CRUD лежит в стеке родительского
+    greenlet, который ждет на greenlet_spawn. Стек разбирается только
+    для медленных запросов.
+    """
+    frames = [sys._getframe()]
+    parent = greenlet.getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        frames.append(parent.gr_frame)
+    for frame in frames:
+        while frame is not None:
+            if _CRUD_PATH in frame.f_code.co_filename:
+                return frame.f_code.co_qualname
+            frame = frame.f_back
+    return None
+
+
+def _format_parameters(parameters) -> str:
+    text = repr(parameters)
+    if len(text) > _MAX_PARAMETERS_LENGTH:
+        text = text[:_MAX_PARAMETERS_LENGTH] + f"... ({len(text)} символов)"
+    return text
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, size: int, explain_rate: float, explain_url: Optional[str] = None):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.explain_url = explain_url
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._ids = count(1)
+        self._explain_engine = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._explain_busy = threading.Event()
+        self.recorded = 0
+
+    # --- подключение к движкам ---
+
+    def track(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(context):
+        starts = context.connection.info.get("slow_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["slow_query_start"].pop()
+        if elapsed >= self.threshold:
+            self.record(statement, parameters, elapsed, executemany)
+
+    # --- журнал ---
+
+    def record(self, statement: str, parameters, elapsed: float, executemany: bool = False) -> dict:
+        request = current_request()
+        entry = {
+            "id": next(self._ids),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed * 1000, 3),
+            "statement": statement.strip(),
+            "parameters": _format_parameters(parameters),
+            "executemany": executemany,
+            "method": request[0] if request else None,
+            "route": request[1] if request else None,
+            "crud": _crud_method(),
+            "explain": None,
+            "explain_status": "not_sampled",
+        }
+        if not executemany and is_explainable(statement) and random.random() < self.explain_rate:
+            if self._explain_busy.is_set() or self.explain_url is None:
+                entry["explain_status"] = "skipped"
+            else:
+                entry["explain_status"] = "pending"
+                self._explain_busy.set()
+                self._executor.submit(self._explain, entry, statement, parameters)
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+        return entry
+
+    def entries(self, limit: Optional[int] = None) -> List[dict]:
+        """Новые записи первыми"""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # --- EXPLAIN ---
+
+    def _engine(self):
+        if self._explain_engine is None:
+            # Отдельное соединение без пула: EXPLAIN не занимает соединения приложения
+            self._explain_engine = create_engine(self.explain_url, poolclass=NullPool)
+        return self._explain_engine
+
+    def _explain(self, entry: dict, statement: str, parameters):
+        try:
+            entry["explain"] = self.explain(statement, parameters)
+            entry["explain_status"] = "done"
+        except Exception as e:
+            entry["explain"] = f"{e.__class__.__name__}: {str(e).splitlines()[0]}"
+            entry["explain_status"] = "error"
+        finally:
+            self._explain_busy.clear()
+
+    def explain(self, statement: str, parameters) -> str:
+        connection = self._engine().raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+            cursor.execute(f"SET LOCAL lock_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+            numbered = _NUMBERED_PARAMETER.findall(statement)
+            if numbered:
+                # Стиль asyncpg: $1, $2 понимает только PREPARE
+                cursor.execute(f"PREPARE slow_query_explain AS {statement}")
+                placeholders = ", ".join(["%s"] * max(map(int, numbered)))
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) EXECUTE slow_query_explain({placeholders})",
+                               tuple(parameters))
+            else:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters or None)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def wait_for_explain(self):
+        """Дождаться текущего EXPLAIN (для скриптов)"""
+        self._executor.submit(lambda: None).result()
+
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_BUFFER, SLOW_QUERY_EXPLAIN_RATE)
+
+
+def track_slow_queries(explain_url: str, *engines):
+    """Подключает журнал к движкам, если SLOW_QUERY_LOG включен; иначе накладных расходов нет"""
+    if not SLOW_QUERY_LOG:
+        return
+    slow_query_log.explain_url = explain_url
+    for engine in engines:
+        slow_query_log.track(engine)
+
+
+def slow_query_report(limit: Optional[int] = None) -> dict:
+    return {
+        "enabled": SLOW_QUERY_LOG,
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_rate": SLOW_QUERY_EXPLAIN_RATE,
+        "recorded": slow_query_log.recorded,
+        "entries": slow_query_log.entries(limit),
+    }
@@ -0,0 +1,150 @@
+"""
+Запуск воркера без создания и отражения схемы.
+
+Схема создается только миграциями (alembic upgrade head) одним процессом
+до запуска воркеров. Воркер в lifespan делает две вещи, прежде чем
+начать принимать запросы:
+
+1. сверяет alembic_version с головой миграций — один SELECT. Ревизии
+   читаются из заголовков файлов alembic/versions без импорта alembic:
+   импорт стоит ~100 мс на каждый воркер;
+2. открывает DB_POOL_WARMUP соединений пула (по умолчанию DB_POOL_SIZE),
+   чтобы первые запросы не платили за установку соединения.
+
+После старта воркер раз в ORDERS_PARTITIONS_CHECK_INTERVAL секунд
+создает недостающие месячные партиции orders на ORDERS_PARTITIONS_AHEAD
+месяцев вперед. Воркеры делают это по очереди (advisory-блокировка в
+orders_create_partition), повторный вызов ничего не меняет.
+
+SCHEMA_CHECK=strict (по умолчанию) не дает воркеру стартовать, если
+alembic_version нет или ревизия отстает от кода. Незнакомая ревизия
+допускается: при rolling deploy база уже обновлена миграциями новой
+версии, а старые воркеры еще перезапускаются. SCHEMA_CHECK=off отключает
+проверку.
+"""
+import ast
+import asyncio
+import os
+import re
+import sys
+from contextlib import asynccontextmanager, suppress
+from datetime import date
+from typing import Dict, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.crud.book import AsyncOrderCRUD
+from app.database import (
+    POOL_OPTIONS, AsyncSessionLocal, async_engine, async_replica_engines, engine, replica_engines
+)
+from app.metrics import registry
+from app.replicas import use_primary
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic", "versions")
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "strict").lower()
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(POOL_OPTIONS["pool_size"])))
+ORDERS_PARTITIONS_AHEAD = int(os.getenv("ORDERS_PARTITIONS_AHEAD", "3"))
+ORDERS_PARTITIONS_CHECK_INTERVAL = float(os.getenv("ORDERS_PARTITIONS_CHECK_INTERVAL", "86400"))
+
+_REVISION_LINE = re.compile(r"^(revision|down_revision)\s*(?::[^=]*)?=\s*(.+?)\s*$", re.MULTILINE)
+_ALEMBIC_VERSION = text("SELECT version_num FROM alembic_version")
+_PING = text("SELECT 1")
+
+
+class SchemaVersionError(RuntimeError):
+    """Ревизия базы отстает от миграций кода"""
+
+
+def migration_revisions(directory: str = MIGRATIONS_DIR) -> Dict[str, Tuple[str, ...]]:
+    """{ревизия: родительские ревизии} из заголовков файлов миграций"""
+    revisions = {}
+    for name in os.listdir(directory):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            header = dict(_REVISION_LINE.findall(f.read()))
+        if "revision" not in header:
+            continue
+        parents = ast.literal_eval(header.get("down_revision", "None"))
+        if isinstance(parents, str):
+            parents = (parents,)
+        revisions[ast.literal_eval(header["revision"])] = tuple(parents or ())
+    return revisions
+
+
+def migration_heads(revisions: Dict[str, Tuple[str, ...]]) -> Set[str]:
+    parents = {parent for revision_parents in revisions.values() for parent in revision_parents}
+    return set(revisions) - parents
+
+
+async def check_schema_version():
+    if SCHEMA_CHECK == "off":
+        return
+    revisions = migration_revisions()
+    heads = migration_heads(revisions)
+    try:
+        async with async_engine.connect() as connection:
+            current = set((await connection.execute(_ALEMBIC_VERSION)).scalars())
+    except ProgrammingError:
+        current = set()
+    if not current:
+        raise SchemaVersionError("В базе нет alembic_version: выполните alembic upgrade head")
+    if current == heads or not current.issubset(revisions):
+        return
+    raise SchemaVersionError(
+        f"Ревизия базы {', '.join(sorted(current))} отстает от миграций {', '.join(sorted(heads))}: "
+        f"выполните alembic upgrade head"
+    )
+
+
+async def warm_up_pool(size: int = DB_POOL_WARMUP):
+    """Открывает size соединений одновременно; после возврата они остаются в пуле"""
+    size = min(size, POOL_OPTIONS["pool_size"])
+
+    async def ping(target):
+        async with target.connect() as connection:
+            await connection.execute(_PING)
+
+    await asyncio.gather(*(ping(target) for target in [async_engine, *async_replica_engines] for _ in range(size)))
+
+
+def _months_later(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+async def maintain_orders_partitions(
+    months_ahead: int = ORDERS_PARTITIONS_AHEAD, interval: float = ORDERS_PARTITIONS_CHECK_INTERVAL
+):
+    while True:
+        today = date.today()
+        try:
+            async with use_primary(AsyncSessionLocal()) as db:
+                await AsyncOrderCRUD.create_partitions(db, today, _months_later(today, months_ahead))
+        except Exception as e:
+            # Цикл не падает: следующая проверка повторит попытку. Пока партиции нет,
+            # заказы копятся в orders_default, поэтому сбой виден в stderr и /metrics
+            registry.observe_partition_maintenance_failure()
+            print(f"Партиции orders не созданы: {e.__class__.__name__}: {e}", file=sys.stderr)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    partitions = None
+    try:
+        await check_schema_version()
+        await warm_up_pool()
+        partitions = asyncio.create_task(maintain_orders_partitions())
+        yield
+    finally:
+        if partitions is not None:
+            partitions.cancel()
+            with suppress(asyncio.CancelledError):
+                await partitions
+        # Соединения закрываются и при неудачном старте, и при остановке воркера
+        for target in [async_engine, *async_replica_engines]:
+            await target.dispose()
+        for target in [engine, *replica_engines]:
+            target.dispose()
@@ -0,0 +1,58 @@
+"""
+Потоковая отдача больших выборок в формате NDJSON.
+
+Строки читаются из базы серверным курсором пачками и сразу пишутся
+в ответ, поэтому память не растет с размером результата, а первый байт
+уходит клиенту после первой пачки, а не после всей выборки.
+"""
+from typing import AsyncIterator, Callable, List
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.responses import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    """Потоковый режим: ?stream=true или Accept: application/x-ndjson"""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _encode_batch(batch: List[dict]) -> bytes:
+    return b"".join(dumps(item) + b"\n" for item in batch)
+
+
+async def ndjson_response(batches: Callable[[AsyncSession], AsyncIterator[List]]) -> StreamingResponse:
+    """
+    batches(db) — асинхронный генератор пачек строк из CRUD-слоя.
+
+    Курсор живет дольше обработчика маршрута, поэтому поток открывает
+    собственную сессию, а не использует сессию из Depends. Первая пачка
+    читается до отправки заголовков: ошибка запроса превратится в обычный
+    ответ 500, а не в оборванный поток со статусом 200.
+    """
+    db = AsyncSessionLocal()
+    iterator = batches(db).__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = []
+    except BaseException:
+        await db.close()
+        raise
+
+    async def body():
+        try:
+            if first:
+                yield _encode_batch(first)
+            async for batch in iterator:
+                yield _encode_batch(batch)
+        finally:
+            await iterator.aclose()
+            await db.close()
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Разовый пересчет сводок по таблице orders: book_stats и daily_sales.
+
+Триггеры на orders поддерживают сводки при каждой вставке; этот скрипт
+нужен после загрузки данных в обход триггеров или для проверки расхождений.
+На время пересчета вставка заказов блокируется (LOCK orders IN SHARE MODE).
+
+  python3 scripts/backfill_stats.py                # обе сводки
+  python3 scripts/backfill_stats.py --only daily   # только daily_sales
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.crud.book import BookStatCRUD, OrderCRUD
+
+# Сводка -> (описание, функция пересчета)
+ROLLUPS = {
+    "stats": ("book_stats", BookStatCRUD.backfill),
+    "daily": ("daily_sales", OrderCRUD.backfill_daily_sales),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пересчет сводок по заказам")
+    parser.add_argument("--only", choices=sorted(ROLLUPS), help="Пересчитать только одну сводку")
+    args = parser.parse_args(argv)
+
+    for key in [args.only] if args.only else ROLLUPS:
+        table, backfill = ROLLUPS[key]
+        print(f" Пересчет {table}...")
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            rows = backfill(db)
+        print(f" Готово: {rows} строк в {table} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк CRUD-слоя и маршрутов API.
+
+Заполняет локальный PostgreSQL набором данных фиксированного размера
+(через COPY из fill_db.py), затем замеряет каждый метод BookCRUD/OrderCRUD
+и каждый маршрут app/routers/books.py через ASGI-клиент внутри процесса.
+Для каждого сценария считаются p50/p95/p99, число SQL-запросов на вызов
+и строк в секунду. Результат пишется в JSON, два прогона можно сравнить:
+
+  python3 scripts/benchmark.py --output before.json
+  python3 scripts/benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные через движки приложения"""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def summarize(latencies, queries, rows):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    calls = len(latencies)
+    return {
+        "iterations": calls,
+        "mean_ms": round(total / calls * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_call": round(queries / calls, 2),
+        "rows_per_call": round(rows / calls, 2),
+        "rows_per_sec": round(rows / total, 1) if total else 0.0,
+    }
+
+
+def count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, tuple) and len(result) == 2 and all(isinstance(x, int) for x in result):
+        return sum(result)
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    return 1
+
+
+class Benchmark:
+    def __init__(self, args):
+        from app.database import SessionLocal, engine, async_engine
+
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.counter = QueryCounter(engine, async_engine.sync_engine)
+        self.session_factory = SessionLocal
+        self.results = {}
+        self._isbn = 0
+
+        with SessionLocal() as db:
+            from sqlalchemy import text
+            self.book_ids = [row[0] for row in db.execute(text("SELECT id FROM books ORDER BY id"))]
+            self.emails = [row[0] for row in db.execute(text(
+                "SELECT DISTINCT customer_email FROM orders LIMIT 1000"
+            ))]
+            self.genres = [row[0] for row in db.execute(text(
+                "SELECT DISTINCT genre FROM books WHERE genre IS NOT NULL"
+            ))]
+            self.order_dates = [row[0] for row in db.execute(text(
+                "SELECT DISTINCT order_date FROM orders LIMIT 365"
+            ))] or [date.today()]
+            # Книга с неограниченным запасом для сценариев создания заказов
+            self.stock_book_id = self.book_ids[0]
+            db.execute(text("UPDATE books SET quantity = 1000000000 WHERE id = :id"), {"id": self.stock_book_id})
+            db.commit()
+        if not self.book_ids:
+            raise SystemExit("В базе нет книг: запустите без --skip-seed")
+
+    # --- генераторы аргументов ---
+
+    def book_id(self):
+        return self.rng.choice(self.book_ids)
+
+    def new_book(self):
+        self._isbn += 1
+        return {
+            "title": f"Benchmark book {self._isbn}",
+            "author": "Benchmark Author",
+            "isbn": f"8{self.args.seed % 100:02d}{self._isbn:010d}",
+            "price": "19.99",
+            "quantity": 10,
+            "genre": self.rng.choice(self.genres or ["Fiction"]),
+            "metadata_info": {"tags": ["benchmark"], "pages": 300},
+        }
+
+    def new_order(self):
+        return {
+            "book_id": self.stock_book_id,
+            "customer_name": "Bench Customer",
+            "customer_email": "bench@example.com",
+            "order_date": date.today().isoformat(),
+            "quantity": 1,
+        }
+
+    def record(self, name, latencies, queries, rows, error=None):
+        if error is not None:
+            self.results[name] = {"error": error}
+            print(f"  {name:<45} ошибка: {error}")
+            return
+        summary = summarize(latencies, queries, rows)
+        self.results[name] = summary
+        print(f"  {name:<45} p50 {summary['p50_ms']:>8.2f}  p95 {summary['p95_ms']:>8.2f}  "
+              f"p99 {summary['p99_ms']:>8.2f} мс  запросов {summary['queries_per_call']:>5}  "
+              f"строк/с {summary['rows_per_sec']:>10}")
+
+    # --- CRUD ---
+
+    def crud_cases(self):
+        from app.crud.book import BookCRUD, BookStatCRUD, OrderCRUD
+        from app.schemas.book import BookCreate, BookUpdate, OrderCreate
+
+        created = []
+
+        def create_book(db):
+            book = BookCRUD.create_book(db, BookCreate(**self.new_book()))
+            created.append(book.id)
+            return book
+
+        def delete_book(db):
+            return BookCRUD.delete_book(db, created.pop()) if created else None
+
+        def discount(db):
+            # Скидка 0% дает ту же нагрузку, но не меняет данные между прогонами
+            return BookCRUD.apply_discount_to_genre(db, self.rng.choice(self.genres), Decimal(0))[0]
+
+        def reprice_batch(db):
+            book_ids = BookCRUD.reprice_candidates(db, self.genres[:3], 0)
+            result = BookCRUD.reprice_batch(db, book_ids, self.genres[:3], "percent", Decimal(0))[0]
+            db.commit()
+            return result
+
+        def upsert(db):
+            rows = [BookCreate(**self.new_book()).model_dump() for _ in range(100)]
+            result = BookCRUD.upsert_books(db, rows)
+            db.commit()
+            return result
+
+        return [
+            ("BookCRUD.get_book", lambda db: BookCRUD.get_book(db, self.book_id())),
+            ("BookCRUD.get_books", lambda db: BookCRUD.get_books(db, self.rng.randrange(len(self.book_ids)), 100)),
+            ("BookCRUD.get_book_versions", lambda db: BookCRUD.get_book_versions(
+                db, self.rng.randrange(len(self.book_ids)), 100)),
+            ("BookCRUD.get_books_keyset", lambda db: BookCRUD.get_books_keyset(db, "title", False, None, 100)),
+            ("BookCRUD.get_books_by_author", lambda db: BookCRUD.get_books_by_author(db, "Smith")),
+            ("BookCRUD.create_book", create_book),
+            ("BookCRUD.upsert_books", upsert),
+            ("BookCRUD.update_book", lambda db: BookCRUD.update_book(
+                db, self.book_id(), BookUpdate(description=f"updated {time.time()}"))),
+            ("BookCRUD.delete_book", delete_book),
+            ("BookCRUD.get_books_by_filters", lambda db: BookCRUD.get_books_by_filters(
+                db, genre=self.rng.choice(self.genres), in_stock=True)),
+            ("BookCRUD.stream_books_by_filters", lambda db: [book for batch in BookCRUD.stream_books_by_filters(
+                db, genre=self.rng.choice(self.genres), in_stock=True) for book in batch]),
+            ("BookCRUD.get_books_with_orders", lambda db: BookCRUD.get_books_with_orders(db, 0, 100)),
+            ("BookCRUD.get_genre_statistics", lambda db: BookCRUD.get_genre_statistics(db)[1]),
+            ("BookCRUD.refresh_genre_statistics", lambda db: BookCRUD.refresh_genre_statistics(db, wait=True)),
+            ("BookCRUD.apply_discount_to_genre", discount),
+            ("BookCRUD.reprice_candidates", lambda db: BookCRUD.reprice_candidates(db, self.genres[:3], 0)),
+            ("BookCRUD.reprice_batch", reprice_batch),
+            ("BookCRUD.reprice_genres", lambda db: BookCRUD.reprice_genres(
+                db, self.genres[:3], "absolute", Decimal(0))[0]),
+            ("BookCRUD.search_in_metadata", lambda db: BookCRUD.search_in_metadata(db, "English")),
+            ("BookCRUD.query_metadata", lambda db: BookCRUD.query_metadata(
+                db, contains={"language": "English"}, ranges=[("pages", 200.0, 400.0)])),
+            ("BookCRUD.suggest", lambda db: BookCRUD.suggest(db, self.rng.choice("abcdefghijklmnoprstw"), 8)[0]),
+            ("BookCRUD.search_books_fulltext", lambda db: BookCRUD.search_books_fulltext(db, "time world")),
+            ("BookCRUD.stream_search_in_metadata", lambda db: [row for batch in BookCRUD.stream_search_in_metadata(
+                db, "English") for row in batch]),
+            ("BookCRUD.stream_search_books_fulltext", lambda db: [book for batch in BookCRUD.stream_search_books_fulltext(
+                db, "time world") for book in batch]),
+            ("OrderCRUD.create_order", lambda db: OrderCRUD.create_order(db, OrderCreate(**self.new_order()))),
+            ("OrderCRUD.get_orders_by_customer", lambda db: OrderCRUD.get_orders_by_customer(
+                db, self.rng.choice(self.emails or ["bench@example.com"]))),
+            ("OrderCRUD.get_orders_by_customer[month]", lambda db: OrderCRUD.get_orders_by_customer(
+                db, self.rng.choice(self.emails or ["bench@example.com"]),
+                max(self.order_dates) - timedelta(days=30), max(self.order_dates))),
+            ("OrderCRUD.get_daily_sales", lambda db: OrderCRUD.get_daily_sales(db, self.rng.choice(self.order_dates))),
+            ("OrderCRUD.get_daily_sales_range", lambda db: OrderCRUD.get_daily_sales_range(
+                db, min(self.order_dates), max(self.order_dates))),
+            ("OrderCRUD.backfill_daily_sales", OrderCRUD.backfill_daily_sales),
+            ("BookStatCRUD.get_stats", lambda db: BookStatCRUD.get_stats(db, self.book_id())),
+            ("BookStatCRUD.get_stats_bulk", lambda db: BookStatCRUD.get_stats_bulk(
+                db, [self.book_id() for _ in range(100)])),
+            ("BookStatCRUD.backfill", BookStatCRUD.backfill),
+        ]
+
+    def run_crud(self):
+        from app.crud.book import BookCRUD, BookStatCRUD, OrderCRUD
+
+        print("\n CRUD-слой (синхронная сессия):")
+        cases = self.crud_cases()
+        self._report_missing(
+            {f"{cls.__name__}.{name}" for cls in (BookCRUD, BookStatCRUD, OrderCRUD)
+             for name in vars(cls) if not name.startswith("_")},
+            {name for name, _ in cases}
+        )
+        for name, call in cases:
+            latencies, rows = [], 0
+            try:
+                for i in range(self.args.warmup + self.args.iterations):
+                    with self.session_factory() as db:
+                        queries_before = self.counter.count
+                        started = time.perf_counter()
+                        result = call(db)
+                        elapsed = time.perf_counter() - started
+                    if i == self.args.warmup:
+                        queries_start = queries_before
+                    if i >= self.args.warmup:
+                        latencies.append(elapsed)
+                        rows += count_rows(result)
+                self.record(name, latencies, self.counter.count - queries_start, rows)
+            except Exception as e:
+                self.record(name, None, 0, 0, error=f"{e.__class__.__name__}: {str(e).splitlines()[0]}")
+
+    # --- сериализация списков ---
+
+    def serialization_cases(self):
+        """
+        Прежний путь списков (ORM-объекты -> BookInDB с from_attributes ->
+        json.dumps, как в JSONResponse) против нынешнего (строки Core ->
+        orjson без повторной валидации) на одной и той же странице.
+        """
+        from pydantic import TypeAdapter
+        from sqlalchemy import select
+        from app.crud.book import _BOOK_COLUMNS, _row_dicts
+        from app.models.book import Book
+        from app.responses import dumps
+        from app.schemas.book import BookInDB
+
+        adapter = TypeAdapter(list[BookInDB])
+
+        def orm_pydantic(size):
+            def call(db):
+                books = db.execute(select(Book).order_by(Book.id).limit(size)).scalars().all()
+                content = adapter.dump_python(adapter.validate_python(books, from_attributes=True), mode="json")
+                json.dumps(content, ensure_ascii=False).encode()
+                return books
+            return call
+
+        def core_orjson(size):
+            def call(db):
+                rows = _row_dicts(db.execute(select(*_BOOK_COLUMNS).order_by(Book.id).limit(size)))
+                dumps(rows)
+                return rows
+            return call
+
+        cases = []
+        for size in (100, 1000):
+            cases.append((f"ORM + pydantic + json ({size})", orm_pydantic(size)))
+            cases.append((f"Core + orjson ({size})", core_orjson(size)))
+        return cases
+
+    def run_serialization(self):
+        print("\n Сериализация списков (запрос + кодирование JSON):")
+        for name, call in self.serialization_cases():
+            latencies, rows = [], 0
+            for i in range(self.args.warmup + self.args.iterations):
+                with self.session_factory() as db:
+                    queries_before = self.counter.count
+                    started = time.perf_counter()
+                    result = call(db)
+                    elapsed = time.perf_counter() - started
+                if i == self.args.warmup:
+                    queries_start = queries_before
+                if i >= self.args.warmup:
+                    latencies.append(elapsed)
+                    rows += count_rows(result)
+            self.record(name, latencies, self.counter.count - queries_start, rows)
+
+    # --- маршруты ---
+
+    def route_cases(self):
+        created = []
+
+        def bulk_body():
+            return "\n".join(json.dumps(self.new_book()) for _ in range(100)).encode()
+
+        async def create_book(client):
+            response = await client.post("/books/", json=self.new_book())
+            if response.status_code == 200:
+                created.append(response.json()["id"])
+            return response
+
+        async def delete_book(client):
+            return await client.delete(f"/books/{created.pop() if created else 0}")
+
+        # Условные GET: первый вызов (прогрев) запоминает ETag, остальные шлют If-None-Match
+        etags = {}
+
+        async def conditional_get(client, url, params=None):
+            key = (url, json.dumps(params, sort_keys=True))
+            if key not in etags:
+                etags[key] = (await client.get(url, params=params)).headers.get("etag", "")
+            return await client.get(url, params=params, headers={"If-None-Match": etags[key]})
+
+        # Переоценка на 0% проходит все пачки, но не меняет цены между прогонами
+        jobs = []
+
+        async def create_repricing_job(client):
+            response = await client.post("/books/repricing", json={
+                "genres": self.genres[:3], "change_type": "percent", "amount": "0"})
+            if response.status_code == 202:
+                jobs.append(response.json()["id"])
+            return response
+
+        day = self.rng.choice(self.order_dates)
+        fixed_book_id = self.book_id()
+        return [
+            ("POST /books/", create_book),
+            ("POST /books/bulk", lambda c: c.post(
+                "/books/bulk", content=bulk_body(), headers={"content-type": "application/x-ndjson"})),
+            ("GET /books/", lambda c: c.get("/books/", params={"skip": self.rng.randrange(len(self.book_ids)), "limit": 100})),
+            ("GET /books/?fields=title,author,price", lambda c: c.get("/books/", params={
+                "skip": self.rng.randrange(len(self.book_ids)), "limit": 100, "fields": "title,author,price"})),
+            ("GET /books/ (If-None-Match)", lambda c: conditional_get(c, "/books/", {"skip": 0, "limit": 100})),
+            ("GET /books/cursor/", lambda c: c.get("/books/cursor/", params={"sort_by": "title", "limit": 100})),
+            ("GET /books/suggest", lambda c: c.get("/books/suggest", params={
+                "q": "".join(self.rng.choice("abcdefghijklmnoprstw") for _ in range(2))})),
+            ("GET /books/{book_id}", lambda c: c.get(f"/books/{self.book_id()}")),
+            ("GET /books/{book_id} (If-None-Match)", lambda c: conditional_get(c, f"/books/{fixed_book_id}")),
+            ("GET /books/{book_id}/stats", lambda c: c.get(f"/books/{self.book_id()}/stats")),
+            ("GET /books/{book_id}/stats (If-None-Match)", lambda c: conditional_get(
+                c, f"/books/{fixed_book_id}/stats")),
+            ("GET /books/stats/", lambda c: c.get(
+                "/books/stats/", params={"ids": [self.book_id() for _ in range(100)]})),
+            ("PUT /books/{book_id}", lambda c: c.put(
+                f"/books/{self.book_id()}", json={"description": f"updated {time.time()}"})),
+            ("DELETE /books/{book_id}", delete_book),
+            ("GET /books/filter/advanced/", lambda c: c.get(
+                "/books/filter/advanced/", params={"genre": self.rng.choice(self.genres), "in_stock": "true"})),
+            ("GET /books/filter/advanced/?stream=true", lambda c: c.get(
+                "/books/filter/advanced/",
+                params={"genre": self.rng.choice(self.genres), "in_stock": "true", "stream": "true"})),
+            ("GET /books/with-orders/", lambda c: c.get("/books/with-orders/", params={"limit": 100})),
+            ("GET /books/statistics/genre/", lambda c: c.get("/books/statistics/genre/")),
+            ("GET /books/statistics/genre/?refresh=true", lambda c: c.get(
+                "/books/statistics/genre/", params={"refresh": "true"})),
+            ("PUT /books/discount/{genre}/", lambda c: c.put(
+                f"/books/discount/{self.rng.choice(self.genres)}/", params={"discount_percent": 0})),
+            ("POST /books/repricing", create_repricing_job),
+            ("GET /books/repricing/{job_id}", lambda c: c.get(f"/books/repricing/{jobs[-1] if jobs else 0}")),
+            ("POST /books/repricing/{job_id}/resume", lambda c: c.post(
+                f"/books/repricing/{jobs[-1] if jobs else 0}/resume")),
+            ("GET /books/search/metadata/", lambda c: c.get("/books/search/metadata/", params={"q": "English"})),
+            ("GET /books/search/fulltext/?fields=title", lambda c: c.get(
+                "/books/search/fulltext/", params={"q": "time world", "fields": "title"})),
+            ("GET /books/search/metadata/query", lambda c: c.get("/books/search/metadata/query", params={
+                "contains": json.dumps({"language": "English"}), "range": "pages:200:400"})),
+            ("GET /books/search/metadata/?stream=true", lambda c: c.get(
+                "/books/search/metadata/", params={"q": "English", "stream": "true"})),
+            ("POST /books/orders/", lambda c: c.post("/books/orders/", json=self.new_order())),
+            ("GET /books/orders/daily/{target_date}/", lambda c: c.get(f"/books/orders/daily/{day}/")),
+            ("GET /books/orders/daily", lambda c: c.get("/books/orders/daily", params={
+                "from": str(max(self.order_dates) - timedelta(days=365)), "to": str(max(self.order_dates))})),
+            ("GET /books/search/fulltext/", lambda c: c.get("/books/search/fulltext/", params={"q": "time world"})),
+            ("GET /books/search/fulltext/?stream=true", lambda c: c.get(
+                "/books/search/fulltext/", params={"q": "time world", "stream": "true"})),
+        ]
+
+    async def run_routes(self):
+        import httpx
+        from app.main import app
+        from app.routers.books import router
+
+        print("\n Маршруты (ASGI внутри процесса):")
+        cases = self.route_cases()
+        self._report_missing(
+            {f"{method} {route.path}" for route in router.routes for method in route.methods},
+            {name for name, _ in cases}
+        )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name, call in cases:
+                latencies, rows, error = [], 0, None
+                for i in range(self.args.warmup + self.args.iterations):
+                    queries_before = self.counter.count
+                    started = time.perf_counter()
+                    try:
+                        response = await call(client)
+                    except Exception as e:
+                        error = f"{e.__class__.__name__}: {str(e).splitlines()[0]}"
+                        break
+                    elapsed = time.perf_counter() - started
+                    if response.status_code >= 500:
+                        error = f"HTTP {response.status_code}"
+                        break
+                    if i == self.args.warmup:
+                        queries_start = queries_before
+                    if i >= self.args.warmup:
+                        latencies.append(elapsed)
+                        rows += count_rows(_response_rows(response))
+                if error:
+                    self.record(name, None, 0, 0, error=error)
+                else:
+                    self.record(name, latencies, self.counter.count - queries_start, rows)
+
+        from app.cache import book_cache
+        stats = book_cache.stats()
+        print(f"  кеш книг ({stats['backend']}): попаданий {stats['hits']}, промахов {stats['misses']}, "
+              f"инвалидаций {stats.get('invalidations', 0)}")
+
+    @staticmethod
+    def _report_missing(available, covered):
+        missing = sorted(available - covered)
+        if missing:
+            print(f"  нет сценариев для: {', '.join(missing)}")
+
+
+def _response_rows(response):
+    if response.status_code != 200:
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        # NDJSON и другие построчные форматы
+        return response.text.count("\n") or None
+    if isinstance(body, dict):
+        for key in ("items", "results", "genres", "days"):
+            if isinstance(body.get(key), list):
+                return body[key]
+        # Ответы массовых операций: число затронутых строк
+        affected = [body[key] for key in ("inserted", "updated", "updated_books") if isinstance(body.get(key), int)]
+        if affected:
+            return sum(affected)
+    return body
+
+
+def seed_database(args):
+    import fill_db
+    from app.database import Base, engine
+    from app.models import book  # noqa: F401  регистрирует модели в Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+    fill_db.load_copy(fill_db.parse_args([
+        "--mode", "copy", "--truncate", "--books", str(args.books), "--orders", str(args.orders),
+        "--seed", str(args.seed), "--database-url", args.database_url,
+    ]))
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\n Сравнение с {baseline_path} (p95, порог {threshold:.0%}):")
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not before or "error" in before or "error" in result:
+            continue
+        delta = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        mark = ""
+        if delta > threshold:
+            mark = "  <-- регрессия"
+            regressions.append(name)
+        elif delta < -threshold:
+            mark = "  ускорение"
+        print(f"  {name:<45} {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f} мс ({delta:+.1%}){mark}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк CRUD и маршрутов Library API")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL"),
+                        help="База для бенчмарка (будет очищена!), по умолчанию BENCH_DATABASE_URL/DATABASE_URL")
+    parser.add_argument("--books", type=int, default=20000, help="Размер набора: книг")
+    parser.add_argument("--orders", type=int, default=100000, help="Размер набора: заказов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200, help="Замеров на сценарий")
+    parser.add_argument("--warmup", type=int, default=20, help="Прогревочных вызовов на сценарий")
+    parser.add_argument("--skip-seed", action="store_true", help="Не пересоздавать набор данных")
+    parser.add_argument("--only", choices=["crud", "serialization", "routes"], help="Запустить только одну группу")
+    parser.add_argument("--output", default="benchmark-results.json", help="Куда записать результаты")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--cache-backend", choices=["memory", "none"], default=os.getenv("CACHE_BACKEND", "memory"),
+                        help="Кеш чтений книг (CACHE_BACKEND); none — замерять каждое чтение из базы")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Допустимый рост p95 при сравнении")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        raise SystemExit("Укажите --database-url или BENCH_DATABASE_URL")
+    # Движки приложения создаются при импорте app.database, поэтому URL задается до импорта
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["CACHE_BACKEND"] = args.cache_backend
+
+    if not args.skip_seed:
+        print(f" Заполнение базы: {args.books} книг, {args.orders} заказов (seed {args.seed})")
+        seed_database(args)
+
+    bench = Benchmark(args)
+    if args.only in (None, "crud"):
+        bench.run_crud()
+    if args.only in (None, "serialization"):
+        bench.run_serialization()
+    if args.only in (None, "routes"):
+        asyncio.run(bench.run_routes())
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "books": args.books,
+            "orders": args.orders,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "cache_backend": args.cache_backend,
+        },
+        "results": bench.results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n Результаты записаны в {args.output}")
+
+    if args.compare:
+        regressions = compare(bench.results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n Регрессии: {len(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
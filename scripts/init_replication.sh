@@ -0,0 +1,5 @@
+#!/bin/bash
+# Разрешает потоковую репликацию для сервиса postgres-replica из docker-compose.yml.
+# Выполняется образом postgres при первой инициализации тома (docker-entrypoint-initdb.d).
+set -e
+echo "host replication ${POSTGRES_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
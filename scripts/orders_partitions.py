@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Обслуживание месячных партиций orders.
+
+Воркеры API сами создают партиции на ORDERS_PARTITIONS_AHEAD месяцев
+вперед; скрипт нужен для остального:
+
+  python3 scripts/orders_partitions.py list
+  python3 scripts/orders_partitions.py create --from 2024-01-01 --to 2024-12-31
+  python3 scripts/orders_partitions.py archive --before 2025-01-01 --schema orders_archive
+  python3 scripts/orders_partitions.py archive --before 2025-01-01 --drop
+
+create переносит заказы этих месяцев из orders_default в новые партиции.
+archive отсоединяет партиции, целиком лежащие раньше --before: таблица
+переезжает в --schema (или остается рядом) либо удаляется с --drop.
+Сводки book_stats и daily_sales отсоединение не меняет, но backfill_stats.py
+пересчитает их только по оставшимся партициям.
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.crud.book import OrderCRUD
+from app.replicas import use_primary
+
+
+def list_partitions(args):
+    with SessionLocal() as db:
+        for partition in OrderCRUD.list_partitions(db):
+            print(f"  {partition['name']:<20} {partition['bound']:<52} "
+                  f"~{partition['estimated_rows']:>10,} строк {partition['total_bytes'] / 2 ** 20:>9.1f} МБ")
+
+
+def create_partitions(args):
+    with use_primary(SessionLocal()) as db:
+        created = OrderCRUD.create_partitions(db, args.date_from, args.date_to)
+    print(f" Создано партиций: {len(created)}" + (f" ({', '.join(created)})" if created else ""))
+
+
+def archive_partitions(args):
+    with use_primary(SessionLocal()) as db:
+        old = [
+            partition["name"] for partition in OrderCRUD.list_partitions(db)
+            if partition["upper_bound"] is not None and partition["upper_bound"] <= args.before
+        ]
+        db.rollback()
+        if not old:
+            print(f" Нет партиций раньше {args.before}")
+            return
+        for name in old:
+            if args.dry_run:
+                print(f"  {name}: будет {'удалена' if args.drop else 'отсоединена'}")
+                continue
+            OrderCRUD.detach_partition(db, name, archive_schema=args.schema, drop=args.drop)
+            target = "удалена" if args.drop else f"перенесена в {args.schema}" if args.schema else "отсоединена"
+            print(f"  {name}: {target}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Месячные партиции таблицы orders")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Партиции, их границы и размер").set_defaults(run=list_partitions)
+
+    create = commands.add_parser("create", help="Создать недостающие партиции за период")
+    create.add_argument("--from", dest="date_from", type=date.fromisoformat, default=date.today())
+    create.add_argument("--to", dest="date_to", type=date.fromisoformat, default=date.today())
+    create.set_defaults(run=create_partitions)
+
+    archive = commands.add_parser("archive", help="Отсоединить партиции раньше даты")
+    archive.add_argument("--before", type=date.fromisoformat, required=True,
+                         help="Отсоединяются партиции, которые целиком раньше этой даты")
+    target = archive.add_mutually_exclusive_group()
+    target.add_argument("--schema", help="Схема, куда перенести отсоединенные партиции")
+    target.add_argument("--drop", action="store_true", help="Удалить отсоединенные партиции")
+    archive.add_argument("--dry-run", action="store_true", help="Только показать, что будет сделано")
+    archive.set_defaults(run=archive_partitions)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Замер времени запуска API.
+
+Каждый прогон запускает uvicorn с --workers воркерами и замеряет:
+  import_s       — импорт app.main в чистом интерпретаторе;
+  first_ok_s     — от запуска процесса до первого успешного ответа --path;
+  all_ready_s    — до "Application startup complete" всех воркеров
+                   (проверка ревизии схемы и прогрев пула пройдены).
+
+База должна быть на голове миграций (alembic upgrade head), URL берется
+из DATABASE_URL, как у приложения:
+
+  python3 scripts/startup_benchmark.py --workers 16 --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_PROBE = "import time; started = time.perf_counter(); import app.main; print(time.perf_counter() - started)"
+
+
+def measure_import() -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _responds(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return False
+
+
+def measure_server(args) -> dict:
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    ready, failed = [], []
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", args.app, "--port", str(args.port), "--workers", str(args.workers)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+
+    def read_log():
+        for line in process.stdout:
+            if "Application startup complete" in line:
+                ready.append(time.perf_counter() - started)
+            elif "Application startup failed" in line or "Traceback" in line:
+                failed.append(line.strip())
+
+    reader = threading.Thread(target=read_log, daemon=True)
+    reader.start()
+    first_ok = None
+    try:
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline and not failed:
+            if first_ok is None and _responds(url):
+                first_ok = time.perf_counter() - started
+            if first_ok is not None and len(ready) >= args.workers:
+                break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        reader.join(timeout=5)
+
+    if failed or first_ok is None:
+        raise SystemExit(f"Сервер не запустился за {args.timeout} с: {failed[0] if failed else 'нет ответа ' + url}")
+    return {
+        "first_ok_s": round(first_ok, 3),
+        "all_ready_s": round(max(ready), 3) if len(ready) >= args.workers else None,
+        "workers_ready": len(ready),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замер запуска Library API: импорт, прогрев, первый ответ")
+    parser.add_argument("--app", default="main:app", help="Приложение для uvicorn")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/books/?limit=1", help="Запрос, ответ 200 на который считается готовностью")
+    parser.add_argument("--timeout", type=float, default=60, help="Сколько ждать запуска, секунд")
+    parser.add_argument("--output", default="startup-results.json", help="Куда записать результаты")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runs = []
+    for run in range(1, args.runs + 1):
+        result = {"import_s": round(measure_import(), 3), **measure_server(args)}
+        runs.append(result)
+        print(f"  прогон {run}: импорт {result['import_s']:.3f} с, первый ответ {result['first_ok_s']:.3f} с, "
+              f"все {result['workers_ready']} воркеров готовы {result['all_ready_s']} с")
+
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ("import_s", "first_ok_s", "all_ready_s") if all(run[key] is not None for run in runs)
+    }
+    print(f"\n Медиана: {summary}")
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "workers": args.workers,
+            "runs": args.runs,
+            "path": args.path,
+        },
+        "summary": summary,
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка оформления заказов.
+
+Создает книгу с заданным запасом и одновременно отправляет на нее сотни
+заказов. Проверяет, что склад не ушел в минус, что число успешных заказов
+равно списанному количеству, и печатает пропускную способность.
+
+По умолчанию запросы идут в приложение внутри процесса (ASGI), с --base-url
+— в запущенный сервер:
+
+  python3 scripts/stress_orders.py --orders 500 --stock 200
+  python3 scripts/stress_orders.py --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def place_orders(client, book_id: int, count: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+
+    async def place(i):
+        async with semaphore:
+            response = await client.post("/books/orders/", json={
+                "book_id": book_id,
+                "customer_name": f"Stress Customer {i}",
+                "customer_email": f"stress{i}@example.com",
+                "order_date": date.today().isoformat(),
+                "quantity": 1,
+            })
+            statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(place(i) for i in range(count)))
+    return statuses, time.perf_counter() - started
+
+
+async def run(args):
+    import httpx
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stress", timeout=60)
+
+    async with client:
+        isbn = f"7{int(time.time() * 1000) % 10**12:012d}"
+        response = await client.post("/books/", json={
+            "title": "Stress test book",
+            "author": "Stress Author",
+            "isbn": isbn,
+            "price": "10.00",
+            "quantity": args.stock,
+        })
+        response.raise_for_status()
+        book_id = response.json()["id"]
+
+        statuses, elapsed = await place_orders(client, book_id, args.orders, args.concurrency)
+        book = (await client.get(f"/books/{book_id}")).json()
+
+    succeeded = statuses.count(200)
+    rejected = statuses.count(400)
+    errors = len(statuses) - succeeded - rejected
+
+    print(f" Заказов отправлено: {args.orders}, конкурентность: {args.concurrency}")
+    print(f"   успешно: {succeeded}, отказ (нет на складе): {rejected}, ошибок: {errors}")
+    print(f"   остаток на складе: {book['quantity']} (было {args.stock})")
+    print(f"   пропускная способность: {len(statuses) / elapsed:,.0f} заказов/с за {elapsed:.2f} с")
+
+    problems = []
+    if book["quantity"] < 0:
+        problems.append("остаток ушел в минус")
+    if args.stock - book["quantity"] != succeeded:
+        problems.append(f"списано {args.stock - book['quantity']}, а успешных заказов {succeeded}")
+    if succeeded != min(args.stock, args.orders):
+        problems.append(f"ожидалось {min(args.stock, args.orders)} успешных заказов")
+    if errors:
+        problems.append(f"{errors} запросов завершились ошибкой")
+
+    if problems:
+        print(" ПРОВАЛ: " + "; ".join(problems))
+        return 1
+    print(" OK: склад согласован, перепродаж нет")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Параллельные заказы одной книги")
+    parser.add_argument("--orders", type=int, default=500, help="Сколько заказов отправить")
+    parser.add_argument("--stock", type=int, default=200, help="Начальный запас книги")
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных запросов")
+    parser.add_argument("--base-url", help="Адрес запущенного API; без него — ASGI внутри процесса")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()